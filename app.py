@@ -1,11 +1,783 @@
 from shiny import App, ui, render, reactive, req
-import tempfile
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+import asyncio
+import threading
 import os
-import difflib
+import re
+import sqlite3
+import uuid
+import time
 from pathlib import Path
-import PyPDF2
-import shutil  # For cleaning up temp directory
-import base64 
+from diff_engine import highlight_changes
+from metrics import (
+    ProfilingMiddleware,
+    active_sessions,
+    document_pages,
+    page_extract_seconds,
+    profiled,
+    registry,
+    session_concurrency,
+    stage_seconds,
+    timed,
+    upload_bytes,
+)
+from pdf_compare import (
+    LAZY_PAGE_DIFFS,
+    STATE_DIR,
+    ComparisonCancelled,
+    ComparisonProgress,
+    ComparisonResult,
+    extract_texts_parallel,
+    extraction_cache,
+    ingest_upload,
+    normalize_document_cached,
+    private_directory,
+    result_variant,
+)
+
+try:
+    # Only needed for the rendered page images of the visual comparison
+    import fitz  # PyMuPDF
+    import numpy as np
+except ImportError:
+    fitz = None
+    np = None
+
+
+# Size of the chunks streamed back to the browser's PDF viewer
+PDF_CHUNK_SIZE = 64 * 1024
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(range_header, file_size):
+    """
+    Parse a single-range HTTP Range header
+
+    Args:
+        range_header: Value of the Range header, e.g. "bytes=0-1023"
+        file_size: Size of the requested file in bytes
+
+    Returns:
+        (start, end) inclusive byte offsets, None if the header should be ignored,
+        or False if the range cannot be satisfied
+    """
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        # Multiple or malformed ranges: fall back to sending the whole file
+        return None
+
+    first, last = match.groups()
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # Suffix range: the last N bytes of the file
+        length = int(last)
+        if length == 0:
+            return False
+        return max(file_size - length, 0), file_size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        # Syntactically invalid range, RFC 7233 says to ignore it
+        return None
+    if start >= file_size:
+        return False
+    end = int(last) if last else file_size - 1
+    return start, min(end, file_size - 1)
+
+
+def iter_file(path, start, length):
+    """Yield `length` bytes of a file starting at `start` in fixed-size chunks"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(PDF_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def serve_pdf(request):
+    """Serve a registered PDF with ETag and Range support"""
+    path = document_store.resolve_token(request.path_params["token"])
+    if not path or not os.path.exists(path):
+        return Response("PDF not found", status_code=404)
+
+    stat = os.stat(path)
+    file_size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{file_size:x}"'
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": "private, max-age=3600",
+    }
+
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (if_range is None or if_range == etag):
+        byte_range = parse_range(range_header, file_size)
+        if byte_range is False:
+            headers["Content-Range"] = f"bytes */{file_size}"
+            return Response(status_code=416, headers=headers)
+
+    if byte_range is None:
+        start, end, status_code = 0, file_size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
+
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="application/pdf")
+
+    return StreamingResponse(
+        iter_file(path, start, length),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/pdf"
+    )
+
+
+async def cache_stats(request):
+    """Report the extraction cache counters as JSON"""
+    return JSONResponse(extraction_cache.stats())
+
+
+class StorageQuotaExceeded(Exception):
+    """Raised when storing a document would exceed the session or global quota"""
+
+
+def process_started(pid):
+    """
+    Boot and start time of a process, which tell it apart from a later process reusing its pid
+
+    Returns:
+        "<boot id>.<start time in clock ticks>", or "" where /proc is not available
+    """
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            boot_id = f.read().strip().replace("-", "")
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            stat = f.read()
+    except OSError:
+        return ""
+    # The command name in parentheses may contain spaces, the start time is field 22
+    return f"{boot_id}.{int(stat.rsplit(b')', 1)[1].split()[19])}"
+
+
+def worker_alive(pid, started=""):
+    """Whether the worker process with this pid and start time is still running on this host"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    # Without a start time only the pid can be checked
+    return not started or process_started(pid) in (started, "")
+
+
+SHA256_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class DocumentStore:
+    """
+    Stored PDFs shared by all sessions and worker processes, deduplicated by content hash
+
+    Every document is kept once as <sha256>.pdf and reference counted by the
+    sessions that use it. The reference counts, and the tokens under which the
+    viewers fetch documents, live in a SQLite database next to the files. Every
+    change runs in an immediate transaction, which serializes the workers, so
+    several uvicorn processes can share one store directory and any of them can
+    serve a document registered by another.
+
+    Unreferenced documents stay available for repeat uploads until they are
+    older than ttl_seconds or the global quota needs their space; a background
+    sweeper removes them. References, tokens and half-ingested uploads of
+    workers that are no longer running are dropped when a worker starts. A
+    worker is identified by its pid and start time, a later process reusing the
+    pid does not keep its rows alive.
+
+    The root directory must only be accessible to the user running the app. A
+    token names a document by its hash and only ever resolves to a file of the
+    store.
+    """
+
+    def __init__(self, root, session_quota, global_quota, ttl_seconds, sweep_interval=60):
+        self.root = root
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.worker = os.getpid()
+        self.worker_started = process_started(self.worker)
+        self.db_path = os.path.join(root, "store.sqlite3")
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+        private_directory(root)
+        with closing(sqlite3.connect(self.db_path, timeout=30)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS refs ("
+                "sha256 TEXT NOT NULL, session_id TEXT NOT NULL, worker INTEGER NOT NULL, "
+                "PRIMARY KEY (sha256, session_id))"
+            )
+            # Tokens used to name a path; they only live as long as their session
+            if "path" in {column for (_, column, *_) in conn.execute("PRAGMA table_info(tokens)")}:
+                conn.execute("DROP TABLE tokens")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                "token TEXT PRIMARY KEY, sha256 TEXT NOT NULL, session_id TEXT NOT NULL, worker INTEGER NOT NULL)"
+            )
+            for table in ("refs", "tokens"):
+                # Stores of older versions only recorded the pid of a worker
+                if "worker_started" not in {column for (_, column, *_) in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN worker_started TEXT NOT NULL DEFAULT ''")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("INSERT OR IGNORE INTO counters (name, value) VALUES ('evictions', 0)")
+            self._recover(conn)
+
+    @contextmanager
+    def _transaction(self):
+        """Connection in an immediate transaction, holding the store's write lock across processes"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def _read(self):
+        return closing(sqlite3.connect(self.db_path, timeout=30))
+
+    def _recover(self, conn):
+        """Drop what crashed or stopped workers left behind"""
+        workers = conn.execute(
+            "SELECT worker, worker_started FROM refs UNION SELECT worker, worker_started FROM tokens"
+        ).fetchall()
+        dead = [(worker, started) for worker, started in workers if not worker_alive(worker, started)]
+        conn.executemany("DELETE FROM refs WHERE worker = ? AND worker_started = ?", dead)
+        conn.executemany("DELETE FROM tokens WHERE worker = ? AND worker_started = ?", dead)
+
+        known = {sha256 for (sha256, ) in conn.execute("SELECT sha256 FROM documents")}
+        for file_name in os.listdir(self.root):
+            path = os.path.join(self.root, file_name)
+            if file_name.endswith(".upload"):
+                # Half-ingested upload, named <pid>-<start time>-<uuid> after the worker ingesting it
+                parts = file_name.split("-")
+                worker, started = parts[0], parts[1] if len(parts) == 3 else ""
+                if worker.isdigit() and not worker_alive(int(worker), started):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+            elif (
+                file_name.endswith(".pdf") and SHA256_PATTERN.fullmatch(file_name[:-4])
+                and file_name[:-4] not in known and os.path.isfile(path) and not os.path.islink(path)
+            ):
+                stat = os.stat(path)
+                conn.execute(
+                    "INSERT INTO documents (sha256, size, last_used) VALUES (?, ?, ?)",
+                    (file_name[:-4], stat.st_size, stat.st_mtime)
+                )
+        missing = [(sha256, ) for sha256 in known if not os.path.exists(self.path(sha256))]
+        conn.executemany("DELETE FROM documents WHERE sha256 = ?", missing)
+
+    def path(self, sha256):
+        return os.path.join(self.root, f"{sha256}.pdf")
+
+    def _session_bytes(self, conn, session_id):
+        (size, ) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM documents "
+            "WHERE sha256 IN (SELECT sha256 FROM refs WHERE session_id = ?)",
+            (session_id, )
+        ).fetchone()
+        return size
+
+    def _total_bytes(self, conn):
+        (size, ) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM documents").fetchone()
+        return size
+
+    def _unreferenced_bytes(self, conn):
+        (size, ) = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM documents WHERE sha256 NOT IN (SELECT sha256 FROM refs)"
+        ).fetchone()
+        return size
+
+    @staticmethod
+    def _return_upload(incoming_path, upload_path):
+        """Put a rejected upload back where it came from, so the user does not have to upload it again"""
+        if os.path.exists(upload_path):
+            # It was copied across file systems
+            os.remove(incoming_path)
+        else:
+            os.replace(incoming_path, upload_path)
+
+    def add(self, upload_path, session_id):
+        """
+        Move an upload into the store and reference it from a session
+
+        A rejected upload is left at upload_path.
+
+        Returns:
+            (stored path, SHA-256) of the document
+        """
+        self.start_sweeper()
+        incoming_path = os.path.join(self.root, f"{self.worker}-{self.worker_started}-{uuid.uuid4().hex}.upload")
+        with stage_seconds.time(stage="ingest"):
+            sha256 = ingest_upload(upload_path, incoming_path)
+        size = os.path.getsize(incoming_path)
+        upload_bytes.observe(size)
+
+        with stage_seconds.time(stage="storage"), self._transaction() as conn:
+            stored = conn.execute("SELECT 1 FROM documents WHERE sha256 = ?", (sha256, )).fetchone()
+            referenced = conn.execute(
+                "SELECT 1 FROM refs WHERE sha256 = ? AND session_id = ?", (sha256, session_id)
+            ).fetchone()
+            if not referenced and self._session_bytes(conn, session_id) + size > self.session_quota:
+                self._return_upload(incoming_path, upload_path)
+                raise StorageQuotaExceeded(
+                    f"Session storage quota of {self.session_quota // (1024 * 1024)} MB exceeded"
+                )
+
+            if stored is None:
+                # Only evict when that makes enough room, referenced documents cannot be evicted
+                if self._total_bytes(conn) - self._unreferenced_bytes(conn) + size > self.global_quota:
+                    self._return_upload(incoming_path, upload_path)
+                    raise StorageQuotaExceeded("Document storage is full, please try again later")
+                self._evict(conn, self.global_quota - size)
+                os.replace(incoming_path, self.path(sha256))
+                conn.execute(
+                    "INSERT INTO documents (sha256, size, last_used) VALUES (?, ?, ?)", (sha256, size, time.time())
+                )
+            else:
+                # Identical document already stored
+                os.remove(incoming_path)
+                conn.execute("UPDATE documents SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+
+            conn.execute(
+                "INSERT OR IGNORE INTO refs (sha256, session_id, worker, worker_started) VALUES (?, ?, ?, ?)",
+                (sha256, session_id, self.worker, self.worker_started)
+            )
+        return self.path(sha256), sha256
+
+    def release(self, sha256, session_id):
+        """Drop a session's reference to a document"""
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM refs WHERE sha256 = ? AND session_id = ?", (sha256, session_id))
+            conn.execute("UPDATE documents SET last_used = ? WHERE sha256 = ?", (time.time(), sha256))
+
+    def release_session(self, session_id):
+        """Drop all references and tokens of a session that has ended"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE documents SET last_used = ? "
+                "WHERE sha256 IN (SELECT sha256 FROM refs WHERE session_id = ?)",
+                (time.time(), session_id)
+            )
+            conn.execute("DELETE FROM refs WHERE session_id = ?", (session_id, ))
+            conn.execute("DELETE FROM tokens WHERE session_id = ?", (session_id, ))
+
+    def register_token(self, sha256, session_id):
+        """Make a stored PDF available under /pdf/<token> on every worker and return the token"""
+        token = uuid.uuid4().hex
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO tokens (token, sha256, session_id, worker, worker_started) VALUES (?, ?, ?, ?, ?)",
+                (token, sha256, session_id, self.worker, self.worker_started)
+            )
+        return token
+
+    def resolve_token(self, token):
+        """Return the path of the PDF registered under a token, or None"""
+        with self._read() as conn:
+            row = conn.execute("SELECT sha256 FROM tokens WHERE token = ?", (token, )).fetchone()
+        if row is None or not SHA256_PATTERN.fullmatch(row[0]):
+            return None
+        path = self.path(row[0])
+        root = os.path.realpath(self.root)
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            return None
+        return path
+
+    def release_tokens(self, tokens):
+        with self._transaction() as conn:
+            conn.executemany("DELETE FROM tokens WHERE token = ?", [(token, ) for token in tokens])
+
+    def _evict(self, conn, target_bytes, expired_before=None):
+        """Remove unreferenced documents, least recently used first, until target_bytes is met"""
+        candidates = conn.execute(
+            "SELECT sha256, size, last_used FROM documents "
+            "WHERE sha256 NOT IN (SELECT sha256 FROM refs) ORDER BY last_used"
+        ).fetchall()
+        total_bytes = self._total_bytes(conn)
+        evicted = 0
+        for sha256, size, last_used in candidates:
+            expired = expired_before is not None and last_used < expired_before
+            if total_bytes <= target_bytes and not expired:
+                continue
+            try:
+                os.remove(self.path(sha256))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM documents WHERE sha256 = ?", (sha256, ))
+            total_bytes -= size
+            evicted += 1
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted, ))
+
+    def sweep(self):
+        """Remove expired unreferenced documents and enforce the global quota"""
+        with self._transaction() as conn:
+            self._evict(conn, self.global_quota, expired_before=time.time() - self.ttl_seconds)
+
+    def start_sweeper(self):
+        """Start the background sweeper thread once"""
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="document-store-sweeper", daemon=True)
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Error sweeping document store: {str(e)}")
+
+    def stats(self):
+        """Return disk usage and reference counts of the store"""
+        with self._read() as conn:
+            documents, total_bytes = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM documents"
+            ).fetchone()
+            (referenced_bytes, ) = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM documents WHERE sha256 IN (SELECT sha256 FROM refs)"
+            ).fetchone()
+            sessions, workers = conn.execute(
+                "SELECT COUNT(DISTINCT session_id), COUNT(DISTINCT worker) FROM refs"
+            ).fetchone()
+            (tokens, ) = conn.execute("SELECT COUNT(*) FROM tokens").fetchone()
+            (evictions, ) = conn.execute("SELECT value FROM counters WHERE name = 'evictions'").fetchone()
+        return {
+            "documents": documents,
+            "bytes": total_bytes,
+            "referenced_bytes": referenced_bytes,
+            "sessions": sessions,
+            "workers": workers,
+            "tokens": tokens,
+            "global_quota": self.global_quota,
+            "session_quota": self.session_quota,
+            "evictions": evictions,
+        }
+
+
+document_store = DocumentStore(
+    os.environ.get("PDF_STORE_DIR") or os.path.join(private_directory(STATE_DIR), "store"),
+    session_quota=int(os.environ.get("PDF_STORE_SESSION_QUOTA", 500 * 1024 * 1024)),
+    global_quota=int(os.environ.get("PDF_STORE_GLOBAL_QUOTA", 10 * 1024 * 1024 * 1024)),
+    ttl_seconds=int(os.environ.get("PDF_STORE_TTL", 3600))
+)
+
+
+async def storage_stats(request):
+    """Report the document store's disk usage as JSON"""
+    return JSONResponse(document_store.stats())
+
+
+registry.gauge("pdf_compare_store_bytes", "Disk usage of the document store",
+               callback=lambda: document_store.stats()["bytes"])
+registry.gauge("pdf_compare_cache_hit_ratio", "Hit ratio of extracted text lookups in the extraction cache",
+               callback=lambda: extraction_cache.stats()["hit_ratio"])
+
+
+async def serve_metrics(request):
+    """Report the metrics of this process in the Prometheus text format"""
+    return Response(registry.render(), media_type=registry.content_type)
+
+
+# Zoom levels offered for the rendered page images
+RENDER_ZOOM_LEVELS = (0.5, 1.0, 1.5, 2.0)
+
+# Grey level difference above which a pixel counts as changed
+PIXEL_DIFF_THRESHOLD = 32
+
+# PyMuPDF is not thread-safe, rendering is serialized
+render_lock = threading.Lock()
+
+
+class PageImageCache:
+    """
+    Rendered page images and difference overlays shared by all sessions
+
+    Keys start with the stored document path, which is named after the document's
+    SHA-256, so identical documents share their images. The least recently used
+    images are dropped once the cache holds more than max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """Return the cached image for key, calling render() to create it on a miss"""
+        with self._lock:
+            if key in self._images:
+                self._images.move_to_end(key)
+                return self._images[key]
+
+        image = render()
+
+        with self._lock:
+            if key not in self._images:
+                self._images[key] = image
+                self.size += len(image)
+                while self.size > self.max_bytes and len(self._images) > 1:
+                    _, dropped = self._images.popitem(last=False)
+                    self.size -= len(dropped)
+        return image
+
+
+page_images = PageImageCache(int(os.environ.get("PAGE_IMAGE_CACHE_BYTES", 256 * 1024 * 1024)))
+
+
+def render_page_pixmap(pdf_path, page_num, zoom):
+    """Rasterize one page of a PDF to an RGB pixmap, None if the page does not exist"""
+    with render_lock:
+        with fitz.open(pdf_path) as document:
+            if not 1 <= page_num <= document.page_count:
+                return None
+            return document[page_num - 1].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+
+def render_page_png(pdf_path, page_num, zoom):
+    """Return one page of a PDF as PNG bytes, cached by (document, page, zoom)"""
+    def render():
+        pixmap = render_page_pixmap(pdf_path, page_num, zoom)
+        return pixmap.tobytes("png") if pixmap is not None else b""
+    return page_images.get((pdf_path, page_num, zoom), render)
+
+
+def pixmap_to_grey(pixmap):
+    """Return a pixmap as a 2-D array of grey levels"""
+    samples = np.frombuffer(pixmap.samples, dtype=np.uint8)
+    rows = samples.reshape(pixmap.height, pixmap.stride)[:, :pixmap.width * pixmap.n]
+    return rows.reshape(pixmap.height, pixmap.width, pixmap.n).mean(axis=2)
+
+
+def render_difference_overlay(original_path, original_page, comparison_path, comparison_page, zoom):
+    """
+    Return a transparent PNG marking the pixels that differ between two pages
+
+    Missing pages count as blank, so an inserted or deleted page is marked entirely.
+    """
+    def render():
+        greys = []
+        for pdf_path, page_num in ((original_path, original_page), (comparison_path, comparison_page)):
+            pixmap = render_page_pixmap(pdf_path, page_num, zoom) if page_num else None
+            greys.append(pixmap_to_grey(pixmap) if pixmap is not None else np.full((1, 1), 255.0))
+
+        # Pad both pages with white to a common size
+        height = max(grey.shape[0] for grey in greys)
+        width = max(grey.shape[1] for grey in greys)
+        padded = []
+        for grey in greys:
+            canvas = np.full((height, width), 255.0)
+            canvas[:grey.shape[0], :grey.shape[1]] = grey
+            padded.append(canvas)
+
+        mask = np.abs(padded[0] - padded[1]) > PIXEL_DIFF_THRESHOLD
+        overlay = np.zeros((height, width, 4), dtype=np.uint8)
+        overlay[mask] = (255, 0, 0, 140)
+        pixmap = fitz.Pixmap(fitz.csRGB, width, height, overlay.tobytes(), True)
+        return pixmap.tobytes("png")
+
+    key = ("overlay", original_path, original_page, comparison_path, comparison_page, zoom)
+    return page_images.get(key, render)
+
+
+def parse_zoom(value):
+    """Return the requested zoom if it is one of RENDER_ZOOM_LEVELS, else 1.0"""
+    try:
+        zoom = float(value)
+    except (TypeError, ValueError):
+        return 1.0
+    return zoom if zoom in RENDER_ZOOM_LEVELS else 1.0
+
+
+async def serve_page_image(request):
+    """Serve one rendered page of a registered PDF as PNG"""
+    path = document_store.resolve_token(request.path_params["token"])
+    if fitz is None or not path or not os.path.exists(path):
+        return Response("Page image not available", status_code=404)
+
+    with stage_seconds.time(stage="render_page_image"):
+        png = await run_in_threadpool(
+            render_page_png, path, request.path_params["page"], parse_zoom(request.query_params.get("zoom"))
+        )
+    if not png:
+        return Response("Page not found", status_code=404)
+    return Response(png, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+
+async def serve_page_overlay(request):
+    """Serve the pixel difference overlay of an aligned page pair as PNG"""
+    original_path = document_store.resolve_token(request.path_params["original_token"])
+    comparison_path = document_store.resolve_token(request.path_params["comparison_token"])
+    if fitz is None or not all(path and os.path.exists(path) for path in (original_path, comparison_path)):
+        return Response("Overlay not available", status_code=404)
+
+    try:
+        original_page = int(request.query_params.get("original_page", 0))
+        comparison_page = int(request.query_params.get("comparison_page", 0))
+    except ValueError:
+        return Response("Invalid page number", status_code=400)
+
+    with stage_seconds.time(stage="render_overlay"):
+        png = await run_in_threadpool(
+            render_difference_overlay, original_path, original_page, comparison_path, comparison_page,
+            parse_zoom(request.query_params.get("zoom"))
+        )
+    return Response(png, media_type="image/png", headers={"Cache-Control": "private, max-age=3600"})
+
+
+# Number of changed lines sent to the browser per chunk of the page diff panel
+PAGE_DIFF_CHUNK_LINES = 200
+
+# The page diff panel is filled client-side in chunks as the user scrolls
+PAGE_DIFF_CSS = """
+.page-diff { font-family: monospace; white-space: pre-wrap; max-height: 300px; overflow-y: auto; }
+.page-diff-added { color: green; background-color: #e6ffe6; }
+.page-diff-removed { color: red; background-color: #ffe6e6; }
+.page-diff-added .page-diff-token { background-color: #a6f3a6; font-weight: bold; }
+.page-diff-removed .page-diff-token { background-color: #f8b4b4; font-weight: bold; }
+.change-heat-strip { display: flex; height: 16px; margin: 10px 0; border: 1px solid #dee2e6; cursor: pointer; }
+.change-heat-cell { flex: 1 1 0; }
+.change-heat-cell.current { outline: 2px solid #0d6efd; outline-offset: -2px; }
+"""
+
+PAGE_DIFF_JS = """
+document.addEventListener("DOMContentLoaded", function () {
+  function requestChunk(panel) {
+    var loaded = panel.childElementCount;
+    if (panel.dataset.loading === "1" || loaded >= Number(panel.dataset.total)) return;
+    panel.dataset.loading = "1";
+    Shiny.setInputValue("page_diff_request",
+      {page: Number(panel.dataset.page), offset: loaded}, {priority: "event"});
+  }
+
+  Shiny.addCustomMessageHandler("page_diff_chunk", function (message) {
+    var panel = document.getElementById("page_diff_lines");
+    // Drop chunks for a page that is no longer shown
+    if (!panel || Number(panel.dataset.page) !== message.page ||
+        panel.childElementCount !== message.offset) return;
+    var fragment = document.createDocumentFragment();
+    // Every line comes with the [start, end) ranges of its changed tokens
+    message.lines.forEach(function (entry) {
+      var line = entry[0], position = 0;
+      var row = document.createElement("div");
+      row.className = line.charAt(0) === "+" ? "page-diff-added" : "page-diff-removed";
+      entry[1].forEach(function (range) {
+        row.appendChild(document.createTextNode(line.slice(position, range[0])));
+        var token = document.createElement("span");
+        token.className = "page-diff-token";
+        token.textContent = line.slice(range[0], range[1]);
+        row.appendChild(token);
+        position = range[1];
+      });
+      row.appendChild(document.createTextNode(line.slice(position)));
+      fragment.appendChild(row);
+    });
+    panel.appendChild(fragment);
+    panel.dataset.loading = "0";
+    // Keep filling until the panel can scroll
+    if (panel.scrollHeight <= panel.clientHeight) requestChunk(panel);
+  });
+
+  // Scroll events do not bubble, listen in the capture phase
+  document.addEventListener("scroll", function (event) {
+    var panel = event.target;
+    if (panel.id !== "page_diff_lines") return;
+    if (panel.scrollTop + panel.clientHeight >= panel.scrollHeight - 200) requestChunk(panel);
+  }, true);
+
+  $(document).on("shiny:value", function (event) {
+    if (event.name !== "page_differences") return;
+    setTimeout(function () {
+      var panel = document.getElementById("page_diff_lines");
+      if (panel) requestChunk(panel);
+    }, 0);
+  });
+});
+"""
+
+
+# The heat strip is rendered once per comparison, the current page is marked client-side
+CHANGE_STRIP_JS = """
+document.addEventListener("DOMContentLoaded", function () {
+  var currentPage = 1;
+
+  function markCurrent() {
+    document.querySelectorAll(".change-heat-cell").forEach(function (cell) {
+      var inCell = Number(cell.dataset.first) <= currentPage && currentPage <= Number(cell.dataset.last);
+      cell.classList.toggle("current", inCell);
+    });
+  }
+
+  document.addEventListener("click", function (event) {
+    var cell = event.target.closest(".change-heat-cell");
+    if (cell) Shiny.setInputValue("heat_strip_page", Number(cell.dataset.page), {priority: "event"});
+  });
+
+  Shiny.addCustomMessageHandler("heat_strip_page", function (message) {
+    currentPage = message.page;
+    markCurrent();
+  });
+
+  $(document).on("shiny:value", function (event) {
+    if (event.name === "change_heat_strip") setTimeout(markCurrent, 0);
+  });
+});
+"""
+
+
+# The PDF viewers only change their #page fragment when navigating
+PDF_VIEWER_JS = """
+document.addEventListener("DOMContentLoaded", function () {
+  Shiny.addCustomMessageHandler("pdf_viewer_page", function (message) {
+    var frame = document.getElementById(message.id);
+    if (frame && frame.getAttribute("src") !== message.src) frame.setAttribute("src", message.src);
+  });
+});
+"""
 
 
 # Define the UI
@@ -29,6 +801,14 @@ app_ui = ui.page_sidebar(
         fluid=True
     ),
     
+    # Styles and chunk loader for the page diff panel, heat strip clicks, page updates for the viewers
+    ui.head_content(
+        ui.tags.style(PAGE_DIFF_CSS),
+        ui.tags.script(PAGE_DIFF_JS),
+        ui.tags.script(CHANGE_STRIP_JS),
+        ui.tags.script(PDF_VIEWER_JS)
+    ),
+    
     # Main content area with cards for each report type
     ui.output_ui("report_content")
 
@@ -43,75 +823,115 @@ def server(input, output, session):
     @reactive.effect
     @reactive.event(input.next_page)
     def _():
-        if not pdf_results.get()["has_compared"]:
+        summary = comparison_summary()
+        if summary is None:
             return
         
-        max_pages = pdf_results.get()["summary"]["max_pages"]
-        new_page = min(current_page.get() + 1, max_pages)
-        current_page.set(new_page)
-        # Update the goto page input
-        ui.update_numeric("goto_page", value=new_page)
+        go_to_page(min(current_page.get() + 1, summary["max_pages"]))
 
     @reactive.effect
     @reactive.event(input.prev_page)
     def _():
-        # Add a debugging notification
-        # ui.notification_show(f"Previous button clicked, current page: {current_page.get()}")
+        if comparison_summary() is None:
+            return
         
-        if not pdf_results.get()["has_compared"]:
+        go_to_page(max(current_page.get() - 1, 1))
+
+    @reactive.effect
+    @reactive.event(input.goto_page)
+    def _():
+        summary = comparison_summary()
+        if summary is None or input.goto_page() is None:
             return
         
-        new_page = max(current_page.get() - 1, 1)
-        current_page.set(new_page)
-        # Update the goto page input
-        ui.update_numeric("goto_page", value=new_page)
+        new_page = max(1, min(input.goto_page(), summary["max_pages"]))
+        # Echoes of our own update_numeric calls arrive here too, and must not
+        # invalidate the outputs a second time
+        if new_page != current_page.get():
+            current_page.set(new_page)
+
+    # Jump between changed pages, found by bisection in the result's change index
+    @reactive.effect
+    @reactive.event(input.next_change)
+    def _():
+        diff_by_page = comparison_result()
+        if diff_by_page is None:
+            return
         
-        # Add another notification to confirm the page was updated
-        # ui.notification_show(f"Page updated to: {current_page.get()}")
+        page = diff_by_page.next_change(current_page.get())
+        if page is None:
+            ui.notification_show("No more differences after this page", type="message")
+            return
+        go_to_page(page)
 
     @reactive.effect
-    @reactive.event(input.goto_page)
+    @reactive.event(input.prev_change)
+    def _():
+        diff_by_page = comparison_result()
+        if diff_by_page is None:
+            return
+        
+        page = diff_by_page.previous_change(current_page.get())
+        if page is None:
+            ui.notification_show("No differences before this page", type="message")
+            return
+        go_to_page(page)
+
+    @reactive.effect
+    @reactive.event(input.heat_strip_page)
     def _():
-        if not pdf_results.get()["has_compared"]:
+        summary = comparison_summary()
+        if summary is None:
             return
         
-        max_pages = pdf_results.get()["summary"]["max_pages"]
-        new_page = max(1, min(input.goto_page(), max_pages))
+        go_to_page(max(1, min(int(input.heat_strip_page()), summary["max_pages"])))
+
+    def go_to_page(new_page):
+        """Move to a page from the buttons and keep the goto page input in step"""
+        if new_page == current_page.get():
+            return
         current_page.set(new_page)
+        # Update the goto page input
+        ui.update_numeric("goto_page", value=new_page)
 
     # Add an output to display the current page and total pages
     @output
     @render.text
     def current_page_display():
-        if not pdf_results.get()["has_compared"]:
+        summary = comparison_summary()
+        if summary is None:
             return "Please compare documents first to view pages"
         
-        max_pages = pdf_results.get()["summary"]["max_pages"]
-        return f"Page {current_page.get()} of {max_pages}"
+        return f"Page {current_page.get()} of {summary['max_pages']}"
 
 
-    # Create a directory for our temporary files that will persist during the session
-    temp_dir = tempfile.mkdtemp()
+    active_sessions.inc()
+    session_concurrency.observe(active_sessions.get())
+    session.on_ended(active_sessions.dec)
 
-    # Add cleanup when session ends
-    @reactive.effect
-    def _():
-        session.on_ended(lambda: shutil.rmtree(temp_dir, ignore_errors=True))
+    # Stored documents are shared between sessions, release our references and
+    # viewer tokens when the session ends
+    session_id = session.id
+    session.on_ended(lambda: document_store.release_session(session_id))
     
-    # Add cleanup when session ends
-    @reactive.effect
-    def _():
-        session.on_ended(lambda: shutil.rmtree(temp_dir, ignore_errors=True))
+    # Tokens of the PDFs this session has made available to the viewers
+    pdf_tokens = []
+
+    def _unregister_pdfs():
+        document_store.release_tokens(pdf_tokens)
+        pdf_tokens.clear()
     
     # Store the results of PDF processing
     pdf_results = reactive.value({
-        "text_diff": None,
+        "page_pairs": [],
         "summary": None,
         "has_compared": False,
         "original_pdf_path": None,  
         "comparison_pdf_path": None,  
-        "original_text": None,
-        "comparison_text": None,
+        "original_pdf_url": None,
+        "comparison_pdf_url": None,
+        "original_pdf_token": None,
+        "comparison_pdf_token": None,
         "summary": {
             "added_lines": 0,
             "removed_lines": 0,
@@ -120,6 +940,34 @@ def server(input, output, session):
             "comparison_name": ""  
         }
     })
+
+    # Outputs read the part of the stored results they show through these
+    @reactive.calc
+    def comparison_summary():
+        """Summary of the stored comparison, None before the first comparison"""
+        results = pdf_results.get()
+        return results["summary"] if results["has_compared"] else None
+
+    @reactive.calc
+    def comparison_result():
+        """ComparisonResult holding the page pairs and page diffs, None before the first comparison"""
+        results = pdf_results.get()
+        return results["diff_by_page"] if results["has_compared"] else None
+
+    @reactive.calc
+    def document_handles():
+        """Stored paths, viewer URLs and tokens of both PDFs, None before the first comparison"""
+        results = pdf_results.get()
+        if not results["has_compared"]:
+            return None
+        return {
+            key: results[key]
+            for key in (
+                "original_pdf_path", "comparison_pdf_path",
+                "original_pdf_url", "comparison_pdf_url",
+                "original_pdf_token", "comparison_pdf_token",
+            )
+        }
     
     @output
     @render.text
@@ -228,7 +1076,8 @@ def server(input, output, session):
                     ),
                     ui.card(
                         ui.card_header("Run Comparision"),
-                        ui.input_action_button("compare_pdfs", "Compare Documents", class_="btn-primary")
+                        ui.input_task_button("compare_pdfs", "Compare Documents", class_="btn-primary"),
+                        ui.input_action_button("cancel_compare", "Cancel", class_="btn-outline-secondary")
                     )
                 ),
                 
@@ -240,7 +1089,7 @@ def server(input, output, session):
     @output
     @render.ui
     def pdf_comparison_results():
-        if not pdf_results.get()["has_compared"]:
+        if comparison_summary() is None:
             return None  # Return nothing if comparison hasn't been run
         
         return ui.div(
@@ -262,9 +1111,24 @@ def server(input, output, session):
                     ui.column(4, ui.input_numeric("goto_page", "Go to page:", 1, min=1, width="100%")),
                     ui.column(4, ui.input_action_button("next_page", "Next Page →", width="100%"))
                 ),
+                ui.layout_columns(
+                    ui.column(6, ui.input_action_button("prev_change", "⇤ Previous Difference", width="100%")),
+                    ui.column(6, ui.input_action_button("next_change", "Next Difference ⇥", width="100%"))
+                ),
+                ui.output_ui("change_heat_strip"),
                 style="text-align: center; margin: 15px 0;"
             ),
-            ui.output_ui("page_differences")
+            ui.input_numeric("numeric_tolerance", "Ignore number changes up to:", 0, min=0, step=0.01),
+            ui.output_ui("page_differences"),
+            ui.card(
+                ui.input_select(
+                    "visual_zoom",
+                    "Image zoom:",
+                    {str(zoom): f"{zoom:.0%}" for zoom in RENDER_ZOOM_LEVELS},
+                    selected="1.0"
+                ),
+                ui.output_ui("visual_diff_results")
+            )
     )
     
     
@@ -286,93 +1150,237 @@ def server(input, output, session):
         file_info = input.pdf_comparison()[0]
         return f"File name: {file_info['name']}\nSize: {file_info['size'] / 1024:.2f} KB"
   
-    def extract_text_from_pdf(file_info):
-        """Extract text from PDF and return both complete text and per-page text"""
-        # Create a permanent file in our temp directory
-        file_name = f"{os.path.splitext(file_info['name'])[0]}_{os.path.basename(file_info['datapath'])}.pdf"
-        temp_path = os.path.join(temp_dir, file_name)
-        
-        # Copy the uploaded file to our temp directory
-        with open(file_info['datapath'], 'rb') as src_file:
-            file_content = src_file.read()
-            with open(temp_path, 'wb') as dest_file:
-                dest_file.write(file_content)
-        
-        # Extract text using PyPDF2
+    # Uploads already moved into the document store, keyed by their upload datapath
+    stored_uploads = {}
+
+    def store_pdf(file_info):
+        """Move an uploaded PDF into the document store and return its path and SHA-256"""
+        # A file is only moved once, comparing the same upload again reuses it
+        if file_info['datapath'] in stored_uploads:
+            stored_path, sha256 = stored_uploads[file_info['datapath']]
+            if os.path.exists(stored_path):
+                return stored_path, sha256
+        
+        stored_path, sha256 = document_store.add(file_info['datapath'], session_id)
+        stored_uploads[file_info['datapath']] = (stored_path, sha256)
+        return stored_path, sha256
+
+    def release_superseded(file_infos):
+        """Drop the session's references to uploads that are no longer being compared"""
+        current = {file_info['datapath'] for file_info in file_infos}
+        for datapath in list(stored_uploads):
+            if datapath not in current:
+                _, sha256 = stored_uploads.pop(datapath)
+                document_store.release(sha256, session_id)
+
+    def extract_text_from_pdfs(file_infos, progress=None):
+        """
+        Extract text from several PDFs concurrently
+
+        Args:
+            progress: Optional ComparisonProgress advanced per page and checked for cancellation
+
+        Returns:
+            List of (complete text, stored path, normalized per-page text) tuples in the order of file_infos
+        """
+        release_superseded(file_infos)
+        stored = [store_pdf(file_info) for file_info in file_infos]
+        temp_paths = [temp_path for temp_path, _ in stored]
+        
         try:
-            text_content = []
-            text_by_page = {}
+            # Repeat uploads are served from the extraction cache
+            pages = [extraction_cache.get(sha256) for _, sha256 in stored]
+            missing = [i for i, text_by_page in enumerate(pages) if text_by_page is None]
+            if progress is not None:
+                cached_pages = sum(len(text_by_page) for text_by_page in pages if text_by_page)
+                progress.add_pages(cached_pages)
+                progress.advance(cached_pages, "Extracting text")
             
-            with open(temp_path, 'rb') as file:
-                # Create a PDF reader object
-                pdf_reader = PyPDF2.PdfReader(file)
-                
-                # Get the number of pages
-                num_pages = len(pdf_reader.pages)
-                
-                # Extract text from each page
-                for page_num in range(num_pages):
-                    page = pdf_reader.pages[page_num]
-                    text = page.extract_text()
-                    if text:  # Only add non-empty text
-                        text_content.append(text)
-                        text_by_page[page_num + 1] = text  # Store by page number (1-based)
+            # Extract the rest using PyPDF2, page-sharded across the process pool
+            if missing:
+                start = time.perf_counter()
+                results = extract_texts_parallel([temp_paths[i] for i in missing], progress=progress)
+                elapsed = time.perf_counter() - start
+                stage_seconds.observe(elapsed, stage="extract")
+                extracted_pages = sum(len(text_by_page) for _, text_by_page in results)
+                for i, (_, text_by_page) in zip(missing, results):
+                    pages[i] = text_by_page
+                    extraction_cache.put(stored[i][1], text_by_page)
+                    # The shards of all documents run interleaved, per page time is an average
+                    if text_by_page:
+                        page_extract_seconds.observe(elapsed / extracted_pages)
+            
+            for text_by_page in pages:
+                document_pages.observe(len(text_by_page))
+            
+            # Diff the normalized text, so extraction noise does not show up as changes
+            with stage_seconds.time(stage="normalize"):
+                pages = [
+                    normalize_document_cached(sha256, text_by_page)
+                    for text_by_page, (_, sha256) in zip(pages, stored)
+                ]
             
-            # Join all pages with newlines and return
-            return "\n".join(text_content), temp_path, text_by_page
+            return [
+                ("\n".join(text_by_page.values()), temp_path, text_by_page)
+                for text_by_page, temp_path in zip(pages, temp_paths)
+            ]
+        
+        except ComparisonCancelled:
+            # Keep the stored uploads so the comparison can be started again
+            raise
         
         except Exception as e:
-            if os.path.exists(temp_path):
-                try:
-                    os.remove(temp_path)
-                except:
-                    pass
+            # The upload is unusable, let the store reclaim it
+            for file_info, (_, sha256) in zip(file_infos, stored):
+                stored_uploads.pop(file_info['datapath'], None)
+                document_store.release(sha256, session_id)
             raise Exception(f"Error extracting text from PDF: {str(e)}")
 
-    #  PDF viewers to use the current_page reactive value
-    @output
-    @render.ui
-    def original_pdf_viewer():
-        if not pdf_results.get()["has_compared"]:
+    def aligned_page(side):
+        """Page of the original (0) or comparison (1) document shown at current_page"""
+        page_pairs = comparison_result().page_pairs
+        index = min(current_page.get(), len(page_pairs)) - 1
+        # Inserted or deleted pages have no counterpart, show the closest preceding page
+        while index >= 0 and page_pairs[index][side] is None:
+            index -= 1
+        return page_pairs[index][side] if index >= 0 else 1
+
+    # Page shown by each viewer. They are only set when the page actually
+    # changes, so moving between pages the viewers have in common, or past an
+    # inserted page on one side, leaves the other viewer alone.
+    viewer_pages = (reactive.value(1), reactive.value(1))
+
+    @reactive.effect
+    def _():
+        if comparison_result() is None:
+            return
+        for side, viewer_page in enumerate(viewer_pages):
+            page = aligned_page(side)
+            with reactive.isolate():
+                if viewer_page.get() != page:
+                    viewer_page.set(page)
+
+    def pdf_viewer(path_key, url_key, frame_id, side, error):
+        """
+        Render a PDF viewer iframe
+
+        The iframe is only rebuilt when a new comparison is stored. Page changes
+        are sent to the browser, which updates the #page fragment of the iframe.
+        """
+        handles = document_handles()
+        if handles is None:
             return ui.p("Please compare documents first to view PDFs")
         
-        orig_path = pdf_results.get()["original_pdf_path"]
-        page = current_page.get() 
+        pdf_path = handles[path_key]
+        pdf_url = handles[url_key]
+        with reactive.isolate():
+            page = aligned_page(side)
         
-        if orig_path and os.path.exists(orig_path):
-            with open(orig_path, "rb") as f:
-                pdf_data = f.read()
-                b64_data = base64.b64encode(pdf_data).decode("utf-8")
-                pdf_url = f"data:application/pdf;base64,{b64_data}"
-            
+        # The browser fetches the document itself from /pdf/<token> using range requests
+        if pdf_path and pdf_url and os.path.exists(pdf_path):
             return ui.tags.iframe(
+                id=frame_id,
                 src=f"{pdf_url}#page={page}&zoom=100%",
                 style="width: 900px; height: 600px; border: none;"
             )
-        return ui.p("Error: Could not load original PDF")
+        return ui.p(error)
 
     @output
     @render.ui
+    @timed("render_viewer")
+    def original_pdf_viewer():
+        return pdf_viewer("original_pdf_path", "original_pdf_url", "original_pdf_frame", 0,
+                          "Error: Could not load original PDF")
+
+    @output
+    @render.ui
+    @timed("render_viewer")
     def comparison_pdf_viewer():
-        if not pdf_results.get()["has_compared"]:
-            return ui.p("Please compare documents first to view PDFs")
+        return pdf_viewer("comparison_pdf_path", "comparison_pdf_url", "comparison_pdf_frame", 1,
+                          "Error: Could not load comparison PDF")
+
+    def follow_viewer_page(side, url_key, frame_id):
+        """Send a viewer's page to the browser whenever it changes"""
+        @reactive.effect
+        async def _():
+            page = viewer_pages[side].get()
+            with reactive.isolate():
+                handles = document_handles()
+                pdf_url = handles[url_key] if handles is not None else None
+            if pdf_url:
+                await session.send_custom_message("pdf_viewer_page", {
+                    "id": frame_id,
+                    "src": f"{pdf_url}#page={page}&zoom=100%",
+                })
+
+    follow_viewer_page(0, "original_pdf_url", "original_pdf_frame")
+    follow_viewer_page(1, "comparison_pdf_url", "comparison_pdf_frame")
+
+    def run_comparison(original_info, comparison_info, progress):
+        """
+        Extract and compare both PDFs, runs on a worker thread
+
+        Returns:
+            Dict with the parts of pdf_results computed by the comparison
+        """
+        # Profiled into PDF_PROFILE_DIR when it is set
+        with profiled("comparison"):
+            return compare_uploads(original_info, comparison_info, progress)
+
+    def compare_uploads(original_info, comparison_info, progress):
+        """Body of run_comparison"""
+        # Extract text from both PDFs with per-page text
+        (_, original_path, original_by_page), (_, comparison_path, comparison_by_page) = \
+            extract_text_from_pdfs([original_info, comparison_info], progress=progress)
         
-        comp_path = pdf_results.get()["comparison_pdf_path"]
-        page = current_page.get() 
+        # Align the pages by fingerprint and diff only the pages that changed.
+        # In lazy mode page diffs are computed when a page is first viewed.
+        # The result keeps the pages as line ids, the extracted texts are dropped.
+        # Results are shared through the cache, so a pair compared before, by
+        # any session or worker, is not diffed again
+        progress.set_message("Comparing pages")
+        original_sha256 = stored_uploads[original_info['datapath']][1]
+        comparison_sha256 = stored_uploads[comparison_info['datapath']][1]
+        comparison = extraction_cache.get_result(original_sha256, comparison_sha256, result_variant())
+        if comparison is None:
+            with stage_seconds.time(stage="diff"):
+                comparison = ComparisonResult(
+                    original_by_page, comparison_by_page, lazy=LAZY_PAGE_DIFFS, progress=progress
+                )
+            extraction_cache.put_result(original_sha256, comparison_sha256, result_variant(), comparison)
+        page_pairs = comparison.page_pairs
+        added_lines, removed_lines = comparison.added_lines, comparison.removed_lines
         
-        if comp_path and os.path.exists(comp_path):
-            with open(comp_path, "rb") as f:
-                pdf_data = f.read()
-                b64_data = base64.b64encode(pdf_data).decode("utf-8")
-                pdf_url = f"data:application/pdf;base64,{b64_data}"
-            
-            return ui.tags.iframe(
-                src=f"{pdf_url}#page={page}&zoom=100%",
-                style="width: 900px; height: 600px; border: none;"
-            )
-        return ui.p("Error: Could not load comparison PDF")   
+        return {
+            "page_pairs": page_pairs,
+            "diff_by_page": comparison,
+            "original_pdf_path": original_path,
+            "comparison_pdf_path": comparison_path,
+            "original_sha256": original_sha256,
+            "comparison_sha256": comparison_sha256,
+            "summary": {
+                "added_lines": added_lines,
+                "removed_lines": removed_lines,
+                "total_changes": None if added_lines is None else added_lines + removed_lines,
+                "changed_pages": sum(1 for _, _, changed in page_pairs if changed),
+                "original_name": original_info["name"],
+                "comparison_name": comparison_info["name"],
+                "max_pages": len(page_pairs)
+            }
+        }
+
+    # Progress of the comparison that is currently running, if any, and its progress bar
+    comparison_progress = reactive.value(None)
+    comparison_progress_bar = reactive.value(None)
 
-    # Process PDFs and compute differences when the compare button is clicked
+    # Extraction and diffing run on a worker thread so other sessions keep being served
+    @ui.bind_task_button(button_id="compare_pdfs")
+    @reactive.extended_task
+    async def comparison_task(original_info, comparison_info, progress):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, run_comparison, original_info, comparison_info, progress)
+
+    # Start the comparison when the compare button is clicked
     @reactive.effect
     @reactive.event(input.compare_pdfs)
     def _():
@@ -381,186 +1389,259 @@ def server(input, output, session):
             ui.notification_show("Please upload both PDF files for comparison", type="error")
             return
         
+        progress = ComparisonProgress()
+        comparison_progress.set(progress)
+        comparison_task(input.pdf_original()[0], input.pdf_comparison()[0], progress)
+
+    # Stop the worker and the task when the cancel button is clicked
+    @reactive.effect
+    @reactive.event(input.cancel_compare)
+    def _():
+        progress = comparison_progress.get()
+        if progress is None or comparison_task.status() != "running":
+            return
+        progress.cancel()
+        comparison_task.cancel()
+
+    # Show the worker's per-page progress while the comparison runs
+    @reactive.effect
+    def _():
+        progress = comparison_progress.get()
+        if progress is None or comparison_task.status() != "running":
+            return
+        
+        reactive.invalidate_later(0.25)
+        pages_done, pages_total, message = progress.snapshot()
+        with reactive.isolate():
+            progress_bar = comparison_progress_bar.get()
+        if progress_bar is None:
+            progress_bar = ui.Progress(min=0, max=1)
+            comparison_progress_bar.set(progress_bar)
+        progress_bar.set(
+            pages_done / pages_total if pages_total else 0,
+            message=message,
+            detail=f"{pages_done} of {pages_total} pages" if pages_total else None
+        )
+
+    # Store the results once the comparison task has finished
+    @reactive.effect
+    def _():
+        status = comparison_task.status()
+        if status == "running" or status == "initial":
+            return
+        
+        with reactive.isolate():
+            progress = comparison_progress.get()
+            progress_bar = comparison_progress_bar.get()
+        if progress is None:
+            return
+        comparison_progress.set(None)
+        if progress_bar is not None:
+            progress_bar.close()
+            comparison_progress_bar.set(None)
+        
+        if status == "cancelled" or progress.cancelled:
+            ui.notification_show("PDF comparison cancelled", type="warning")
+            return
+        
         try:
-            # Extract text from both PDFs with per-page text
-            original_text, original_path, original_by_page = extract_text_from_pdf(input.pdf_original()[0])
-            comparison_text, comparison_path, comparison_by_page = extract_text_from_pdf(input.pdf_comparison()[0])
-            
-            # Compare the texts
-            original_lines = original_text.splitlines()
-            comparison_lines = comparison_text.splitlines()
-            
-            # Generate diff using difflib
-            diff = difflib.unified_diff(
-                original_lines, 
-                comparison_lines, 
-                lineterm='', 
-                fromfile='Original', 
-                tofile='Comparison'
-            )
-            diff_result = list(diff)
-            
-            # Calculate diff by page
-            diff_by_page = {}
-            max_pages = max(max(original_by_page.keys(), default=0), max(comparison_by_page.keys(), default=0))
-            
-            for page_num in range(1, max_pages + 1):
-                orig_page_text = original_by_page.get(page_num, "")
-                comp_page_text = comparison_by_page.get(page_num, "")
-                
-                page_diff = difflib.unified_diff(
-                    orig_page_text.splitlines(),
-                    comp_page_text.splitlines(),
-                    lineterm='',
-                    fromfile=f'Original Page {page_num}',
-                    tofile=f'Comparison Page {page_num}'
-                )
-                diff_by_page[page_num] = list(page_diff)
-            
-            # Calculate statistics
-            added_lines = sum(1 for line in diff_result if line.startswith('+') and not line.startswith('+++'))
-            removed_lines = sum(1 for line in diff_result if line.startswith('-') and not line.startswith('---'))
-            
-            # Store results in the reactive value
-            pdf_results.set({
-                "text_diff": diff_result,
-                "diff_by_page": diff_by_page,
-                "has_compared": True,
-                "original_pdf_path": original_path,
-                "comparison_pdf_path": comparison_path,
-                "original_text": original_text,
-                "comparison_text": comparison_text,
-                "original_by_page": original_by_page,
-                "comparison_by_page": comparison_by_page,
-                "summary": {
-                    "added_lines": added_lines,
-                    "removed_lines": removed_lines,
-                    "total_changes": added_lines + removed_lines,
-                    "original_name": input.pdf_original()[0]["name"],
-                    "comparison_name": input.pdf_comparison()[0]["name"],
-                    "max_pages": max_pages
-                }
-            })
-            
-            # Reset page navigation to start at page 1
-            current_page.set(1)
-            ui.update_numeric("goto_page", value=1, max=max_pages)
-            
-            ui.notification_show("PDF comparison complete", type="message")
-            
+            results = comparison_task.result()
         except Exception as e:
             ui.notification_show(f"Error comparing PDFs: {str(e)}", type="error")
-    
-    # Function to convert first page of PDF to base64 for display
-    def get_pdf_thumbnail(pdf_path):
-        """
-        Extract the first page of a PDF as a base64 encoded image for display
+            return
         
-        Args:
-            pdf_path: Path to the PDF file
-            
-        Returns:
-            Base64 encoded string of the PDF's first page
-        """
-        try:
-            # Read the PDF file
-            with open(pdf_path, 'rb') as f:
-                # Return the entire PDF file as base64
-                pdf_data = f.read()
-                return base64.b64encode(pdf_data).decode('utf-8')
-        except Exception as e:
-            print(f"Error getting PDF thumbnail: {str(e)}")
-            return None
-
-    # Render the visual differences between PDFs
+        # Make the stored files available to the viewers by URL
+        _unregister_pdfs()
+        original_token = document_store.register_token(results["original_sha256"], session_id)
+        comparison_token = document_store.register_token(results["comparison_sha256"], session_id)
+        pdf_tokens.extend([original_token, comparison_token])
+        
+        # Store results in the reactive value
+        shown_page_lines["key"] = None
+        pdf_results.set({
+            **results,
+            "has_compared": True,
+            "original_pdf_url": f"pdf/{original_token}",
+            "comparison_pdf_url": f"pdf/{comparison_token}",
+            "original_pdf_token": original_token,
+            "comparison_pdf_token": comparison_token,
+        })
+        
+        # Reset page navigation to start at page 1
+        max_pages = results["summary"]["max_pages"]
+        current_page.set(1)
+        ui.update_numeric("goto_page", value=1, max=max_pages)
+        
+        ui.notification_show("PDF comparison complete", type="message")
+    
+    # Render the visual differences of the current page as images
     @output
     @render.ui
     def visual_diff_results():
-        if not pdf_results()["has_compared"]:
+        handles = document_handles()
+        if handles is None:
             return ui.p("Click 'Compare Documents' to see a visual comparison of the PDFs.")
         
-        original_path = pdf_results()["original_pdf_path"]
-        comparison_path = pdf_results()["comparison_pdf_path"]
+        if fitz is None:
+            return ui.p("Visual comparison needs PyMuPDF and NumPy to be installed.")
         
-        if not original_path or not comparison_path:
+        summary = comparison_summary()
+        original_token = handles["original_pdf_token"]
+        comparison_token = handles["comparison_pdf_token"]
+        page_pairs = comparison_result().page_pairs
+        if not original_token or not comparison_token or not page_pairs:
             return ui.p("Error: PDF files not available for visual comparison.")
         
-        # Get the PDF data as base64
-        original_pdf = get_pdf_thumbnail(original_path)
-        comparison_pdf = get_pdf_thumbnail(comparison_path)
+        orig_page, comp_page, _ = page_pairs[min(current_page.get(), len(page_pairs)) - 1]
+        zoom = parse_zoom(input.visual_zoom())
+        overlay_url = (
+            f"page-overlay/{original_token}/{comparison_token}"
+            f"?original_page={orig_page or 0}&comparison_page={comp_page or 0}&zoom={zoom}"
+        )
+        
+        def page_image(token, page):
+            if not page:
+                return ui.p("No matching page")
+            return ui.tags.img(src=f"page-image/{token}/{page}?zoom={zoom}", style="width: 100%;")
         
-        if not original_pdf or not comparison_pdf:
-            return ui.p("Error: Could not generate PDF previews.")
-            
-        # Create a side-by-side view of the PDFs
+        # Only the images of the current page are loaded, changed pixels are
+        # marked in red on top of the comparison page
         return ui.div(
             ui.h4(f"Visual Comparison", class_="text-center"),
-            ui.p("Below are the PDF documents side by side for visual comparison. Use your browser's PDF viewer controls to navigate the pages."),
             ui.layout_columns(
                 ui.card(
-                    ui.card_header(f"Original: {pdf_results()['summary']['original_name']}"),
-                    ui.tags.object(
-                        ui.tags.data(src=f"data:application/pdf;base64,{original_pdf}"),
-                        type="application/pdf",
-                        width="100%",
-                        height="600px",
-                        style="border: 1px solid #ddd;"
-                    )
+                    ui.card_header(f"Original: {summary['original_name']}"),
+                    page_image(original_token, orig_page)
                 ),
                 ui.card(
-                    ui.card_header(f"Comparison: {pdf_results()['summary']['comparison_name']}"),
-                    ui.tags.object(
-                        ui.tags.data(src=f"data:application/pdf;base64,{comparison_pdf}"),
-                        type="application/pdf",
-                        width="100%",
-                        height="600px",
-                        style="border: 1px solid #ddd;"
+                    ui.card_header(f"Comparison: {summary['comparison_name']}"),
+                    ui.div(
+                        page_image(comparison_token, comp_page),
+                        ui.tags.img(src=overlay_url, style="position: absolute; top: 0; left: 0; width: 100%;"),
+                        style="position: relative;"
                     )
                 ),
                 col_widths=[6, 6]
             )
         )
     
+    # Changed lines over the whole document, one cell per page or group of pages.
+    # Only rebuilt for a new comparison, the current page is marked by the browser.
+    @output
+    @render.ui
+    def change_heat_strip():
+        diff_by_page = comparison_result()
+        if diff_by_page is None:
+            return None
+        
+        strip = diff_by_page.heat_strip()
+        most_changes = max((changes for _, _, _, changes in strip), default=0) or 1
+        # Lazy results count the changed lines of a page with a lower-bound estimate
+        approximate = "≈" if diff_by_page.lazy else ""
+        cells = []
+        for first, last, first_change, changes in strip:
+            pages = f"Page {first}" if first == last else f"Pages {first}-{last}"
+            cells.append(ui.div(
+                class_="change-heat-cell",
+                title=f"{pages}: {approximate}{changes} changed lines" if changes else f"{pages}: no differences",
+                data_first=str(first),
+                data_last=str(last),
+                data_page=str(first_change or first),
+                style=f"background-color: rgba(220, 53, 69, {changes / most_changes:.2f});" if changes else None,
+            ))
+        return ui.div(*cells, class_="change-heat-strip")
+
+    @reactive.effect
+    async def _():
+        page = current_page.get()
+        await session.send_custom_message("heat_strip_page", {"page": page})
+    
     #page differences output
     @output
     @render.ui
+    @timed("page_differences")
     def page_differences():
-        if not pdf_results.get()["has_compared"]:
+        diff_by_page = comparison_result()
+        if diff_by_page is None:
             return ui.p("Please compare documents first to view differences")
         
         page = current_page.get()
-        diff_by_page = pdf_results.get()["diff_by_page"]
-        max_pages = pdf_results.get()["summary"]["max_pages"]
-        
-        if page > max_pages:
+        if page > len(diff_by_page.page_pairs):
             return ui.p("Page number exceeds document length")
         
         page_diffs = diff_by_page.get(page, [])
+        if diff_by_page.lazy:
+            diff_by_page.prefetch(page)
         if not page_diffs:
             return ui.p(f"No differences detected on page {page}")
         
-        # Create a formatted HTML display of the differences
-        diff_html = []
-        for line in page_diffs:
-            if line.startswith('+') and not line.startswith('+++'):
-                diff_html.append(ui.tags.div(line, style="color: green; background-color: #e6ffe6;"))
-            elif line.startswith('-') and not line.startswith('---'):
-                diff_html.append(ui.tags.div(line, style="color: red; background-color: #ffe6e6;"))
-            #elif line.startswith('@@'):
-            #    diff_html.append(ui.tags.div(line, style="color: purple;"))
-            #else:
-            #    diff_html.append(ui.tags.div(line))
+        orig_page, comp_page, _ = diff_by_page.page_pairs[page - 1]
+        header = f"Differences on Page {page}"
+        if orig_page != comp_page:
+            header += f" (original page {orig_page or 'none'}, comparison page {comp_page or 'none'})"
         
+        # Only an empty panel is rendered here, the browser requests the
+        # changed lines in chunks through page_diff_request as it scrolls
         return ui.card(
-            ui.card_header(f"Differences on Page {page}"),
+            ui.card_header(header),
             ui.div(
-                *diff_html,
-                style="font-family: monospace; white-space: pre-wrap; max-height: 300px; overflow-y: auto;"
+                id="page_diff_lines",
+                class_="page-diff",
+                data_page=str(page),
+                data_total=str(len(page_changed_lines(page, numeric_tolerance())))
             )
         )
 
+    # Changed lines of the page shown in the diff panel, kept for the chunk requests
+    shown_page_lines = {"key": None, "lines": []}
+
+    def page_changed_lines(page, tolerance):
+        """Return the +/- lines of a page's diff with their changed token ranges"""
+        if shown_page_lines["key"] != (page, tolerance):
+            diff_by_page = comparison_result()
+            shown_page_lines["key"] = (page, tolerance)
+            shown_page_lines["lines"] = highlight_changes(diff_by_page.get(page, []), abs_tolerance=tolerance)
+        return shown_page_lines["lines"]
+
+    @reactive.calc
+    def numeric_tolerance():
+        """Numbers that changed by no more than this are not highlighted"""
+        tolerance = input.numeric_tolerance()
+        return max(float(tolerance), 0.0) if tolerance is not None else 0.0
+
+    # Send the next chunk of changed lines to the page diff panel
+    @reactive.effect
+    @reactive.event(input.page_diff_request)
+    async def _():
+        request = input.page_diff_request()
+        page, offset = int(request["page"]), int(request["offset"])
+        if comparison_result() is None:
+            return
+        
+        lines = page_changed_lines(page, numeric_tolerance())
+        await session.send_custom_message("page_diff_chunk", {
+            "page": page,
+            "offset": offset,
+            "lines": lines[offset:offset + PAGE_DIFF_CHUNK_LINES],
+        })
+
 
 
 
 # Create the Shiny app
-app = App(app_ui, server)
+shiny_app = App(app_ui, server)
+
+# Serve the stored PDFs next to the Shiny app so the viewers can load them by URL
+app = Starlette(routes=[
+    Route("/pdf/{token}", serve_pdf, methods=["GET", "HEAD"]),
+    Route("/cache/stats", cache_stats),
+    Route("/storage/stats", storage_stats),
+    Route("/metrics", serve_metrics),
+    Route("/page-image/{token}/{page:int}", serve_page_image),
+    Route("/page-overlay/{original_token}/{comparison_token}", serve_page_overlay),
+    Mount("/", app=shiny_app),
+], middleware=[
+    # Writes a cProfile dump per HTTP request when PDF_PROFILE_DIR is set
+    Middleware(ProfilingMiddleware),
+])
+
@@ -0,0 +1,108 @@
+"""
+Cross-check and time the diff engines on synthetic reconciliation dumps
+
+The generated documents are dominated by repeated lines (rows of zeros and
+separators), which is the worst case for difflib.SequenceMatcher. The second
+case draws every line from a handful of row types, so no line is unique and the
+patience engine relies entirely on its Myers fallback.
+
+Usage:
+    python benchmarks/diff_benchmark.py [lines] [change_ratio]
+"""
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_engine import DIFF_ENGINES, count_changes, cross_check, unified_diff
+
+
+def make_document(num_lines, rng):
+    """A statement-like dump: account rows, many zero rows and separators"""
+    lines = []
+    for i in range(num_lines):
+        kind = rng.random()
+        if kind < 0.6:
+            lines.append("0.00      0.00      0.00      0.00")
+        elif kind < 0.8:
+            lines.append("-" * 40)
+        else:
+            lines.append(f"ACC{rng.randrange(200):04d}  {rng.randrange(100) * 50:>12.2f}")
+    return lines
+
+
+REPEATED_ROWS = (
+    "0.00      0.00      0.00      0.00",
+    "-" * 40,
+    "Subtotal          0.00",
+    "=" * 40,
+    "",
+)
+
+
+def make_repeated_document(num_lines, rng):
+    """A dump made of a few repeated row types only, without any unique line"""
+    return [rng.choice(REPEATED_ROWS) for _ in range(num_lines)]
+
+
+def mutate_repeated(lines, change_ratio, rng):
+    """Replace change_ratio of the lines with another of the repeated row types"""
+    result = list(lines)
+    for position in rng.sample(range(len(result)), int(len(result) * change_ratio)):
+        result[position] = rng.choice([row for row in REPEATED_ROWS if row != result[position]])
+    return result
+
+
+def run_case(name, original, comparison):
+    """Cross-check the engines on one pair of documents and print their timings"""
+    print(f'{name}: {len(original)} lines')
+    print(cross_check(original, comparison))
+
+    for engine in DIFF_ENGINES:
+        start = time.perf_counter()
+        diff_lines = list(unified_diff(original, comparison, engine=engine))
+        seconds = time.perf_counter() - start
+        added_lines, removed_lines = count_changes(diff_lines)
+        print(f'{engine:>10}: {seconds:8.3f} s  +{added_lines} -{removed_lines}')
+
+
+def mutate(lines, change_ratio, rng):
+    """Change, insert and delete roughly change_ratio of the lines"""
+    result = list(lines)
+    for _ in range(int(len(lines) * change_ratio)):
+        position = rng.randrange(len(result))
+        kind = rng.random()
+        if kind < 0.5:
+            result[position] = f"ACC{rng.randrange(500):04d}  {rng.randrange(10 ** 6) / 100:>12.2f}"
+        elif kind < 0.75:
+            result.insert(position, "0.00      0.00      0.00      0.00")
+        else:
+            del result[position]
+    return result
+
+
+def main():
+    num_lines = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    change_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.01
+    rng = random.Random(42)
+
+    # Correctness on many small inputs first, then on the large one
+    for _ in range(200):
+        small = make_document(rng.randrange(1, 60), rng)
+        repeated = make_repeated_document(rng.randrange(1, 60), rng)
+        for engine in DIFF_ENGINES:
+            cross_check(small, mutate(small, 0.2, rng), engine=engine)
+            cross_check(repeated, mutate_repeated(repeated, 0.3, rng), engine=engine)
+
+    original = make_document(num_lines, rng)
+    run_case(f'Statement, change ratio {change_ratio}', original, mutate(original, change_ratio, rng))
+
+    original = make_repeated_document(num_lines, rng)
+    run_case('Repeated rows, change ratio 0.3', original, mutate_repeated(original, 0.3, rng))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark the page-sharded text extraction against the sequential page loop
+
+Usage:
+    python benchmarks/extraction_benchmark.py <file.pdf> [<file.pdf> ...]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_compare import count_pdf_pages, extract_page_range, extract_texts_parallel
+
+
+def extract_serial(pdf_path):
+    """The original loop: every page on the calling thread"""
+    return extract_page_range(pdf_path, 0, count_pdf_pages(pdf_path))
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: extraction_benchmark.py <file.pdf> [<file.pdf> ...]')
+        return
+
+    pdf_paths = sys.argv[1:]
+    total_pages = sum(count_pdf_pages(pdf_path) for pdf_path in pdf_paths)
+
+    start = time.perf_counter()
+    serial = [extract_serial(pdf_path) for pdf_path in pdf_paths]
+    serial_seconds = time.perf_counter() - start
+
+    with ProcessPoolExecutor() as executor:
+        # Warm up the workers so process start-up is not counted
+        list(executor.map(count_pdf_pages, pdf_paths))
+        start = time.perf_counter()
+        parallel = extract_texts_parallel(pdf_paths, executor)
+        parallel_seconds = time.perf_counter() - start
+
+    assert serial == [text_by_page for _, text_by_page in parallel]
+
+    print(f'Documents: {len(pdf_paths)}, pages: {total_pages}, workers: {os.cpu_count()}')
+    print(f'Sequential loop: {serial_seconds:.2f} s, {total_pages / serial_seconds:.1f} pages/s')
+    print(f'Page-sharded:    {parallel_seconds:.2f} s, {total_pages / parallel_seconds:.1f} pages/s')
+    print(f'Speed-up: {serial_seconds / parallel_seconds:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""
+Drive concurrent simulated sessions through upload, compare and paging
+
+Every simulated session speaks the Shiny websocket protocol directly, the way
+the browser does: it uploads a synthetic PDF pair, clicks Compare, then pages
+through the result and requests the first chunk of each page diff. Unlike
+shinyloadtest no recorded browser session is needed.
+
+Without --url a local server is started on a free port with its own empty
+extraction cache and document store, so runs are comparable, and its peak RSS
+is reported once it has been stopped.
+
+Usage:
+    python benchmarks/load_test.py [--sessions N] [--pages P] [--change-ratio R] [--paginate K] [--url URL]
+
+Needs the websockets package.
+"""
+
+from collections import defaultdict
+import argparse
+import asyncio
+import json
+import os
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from workload import format_timings, make_pair, peak_rss_mb
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Outputs are only computed for the client once it reports them as visible
+OUTPUT_IDS = (
+    "report_title", "report_content", "pdf_comparison_results", "current_page_display",
+    "original_pdf_info", "comparison_pdf_info", "original_pdf_viewer", "comparison_pdf_viewer",
+    "change_heat_strip", "page_differences", "visual_diff_results",
+)
+
+STEP_TIMEOUT = 300
+
+
+class SimulatedSession:
+    """One browser session of the app, timing each step into a shared dict of samples"""
+
+    def __init__(self, base_url, timings):
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timings = timings
+        self.websocket = None
+        self.tag = 0
+        # Affinity cookie set by a sticky load balancer in front of several workers
+        self.cookie = None
+        self.max_pages = None
+        self.viewer_urls = {}
+
+    async def receive(self, predicate):
+        """Read server messages until one matches predicate and return it"""
+        while True:
+            message = json.loads(await asyncio.wait_for(self.websocket.recv(), STEP_TIMEOUT))
+            if message.get("errors"):
+                raise RuntimeError(f"Output error: {message['errors']}")
+            if "response" in message and "error" in message["response"]:
+                raise RuntimeError(f"Request error: {message['response']['error']}")
+            viewer_page = message.get("custom", {}).get("pdf_viewer_page")
+            if viewer_page:
+                self.viewer_urls[viewer_page["id"]] = viewer_page["src"].split("#")[0]
+            if predicate(message):
+                return message
+
+    async def call(self, method, *args):
+        """Call a session message handler and return its response value"""
+        self.tag += 1
+        tag = self.tag
+        await self.websocket.send(json.dumps({"method": method, "args": list(args), "tag": tag}))
+        message = await self.receive(lambda m: m.get("response", {}).get("tag") == tag)
+        return message["response"].get("value")
+
+    async def update(self, data, predicate):
+        """Set inputs, wait for the server's reaction and return it"""
+        await self.websocket.send(json.dumps({"method": "update", "data": data}))
+        return await self.receive(predicate)
+
+    async def upload(self, input_id, pdf_path):
+        with open(pdf_path, "rb") as f:
+            data = f.read()
+        job = await self.call("uploadInit", [
+            {"name": os.path.basename(pdf_path), "size": len(data), "type": "application/pdf"}
+        ])
+        headers = {"Cookie": self.cookie} if self.cookie else {}
+        request = urllib.request.Request(self.base_url + job["uploadUrl"], data=data, headers=headers, method="POST")
+        await asyncio.to_thread(lambda: urllib.request.urlopen(request).read())
+        await self.call("uploadEnd", job["jobId"], input_id)
+
+    async def check(self):
+        """Called before the session ends, subclasses verify server state here"""
+
+    def timed(self, step):
+        return StepTimer(self.timings[step])
+
+    async def run(self, original_path, comparison_path, paginate):
+        ws_url = "ws" + self.base_url[len("http"):] + "websocket/"
+        with self.timed("connect"):
+            self.websocket = await websockets.connect(ws_url, max_size=None, close_timeout=1)
+            set_cookie = self.websocket.response.headers.get("Set-Cookie")
+            if set_cookie:
+                self.cookie = set_cookie.split(";", 1)[0]
+            await self.receive(lambda m: "config" in m)
+            inputs = {"report_type": "pdf_compare", "goto_page": 1, "numeric_tolerance": 0,
+                      "visual_zoom": "1.0", ".clientdata_url_search": ""}
+            inputs.update({f".clientdata_output_{name}_hidden": False for name in OUTPUT_IDS})
+            await self.websocket.send(json.dumps({"method": "init", "data": inputs}))
+            await self.receive(lambda m: "report_title" in m.get("values", {}))
+
+        try:
+            with self.timed("upload"):
+                await self.upload("pdf_original", original_path)
+                await self.upload("pdf_comparison", comparison_path)
+
+            with self.timed("compare"):
+                message = await self.update({"compare_pdfs": 1}, page_shown(1))
+            self.max_pages = int(message["values"]["current_page_display"].rsplit(" ", 1)[1])
+
+            for click in range(1, min(paginate, self.max_pages - 1) + 1):
+                page = click + 1
+                with self.timed("next page"):
+                    await self.update({"next_page": click}, page_shown(page))
+                with self.timed("diff chunk"):
+                    await self.update(
+                        {"page_diff_request": {"page": page, "offset": 0}},
+                        lambda m: m.get("custom", {}).get("page_diff_chunk", {}).get("page") == page
+                    )
+            await self.check()
+        finally:
+            await self.websocket.close()
+
+
+class StepTimer:
+    """Context manager appending the duration of a step to a list of samples"""
+
+    def __init__(self, samples):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.samples.append(time.perf_counter() - self.start)
+
+
+def page_shown(page):
+    """Predicate matching the message that shows a page in the page display"""
+    prefix = f"Page {page} of "
+    return lambda m: str(m.get("values", {}).get("current_page_display", "")).startswith(prefix)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(directory):
+    """
+    Start app.py under uvicorn with its cache and store in directory
+
+    Servers started with the same directory share their cache and store.
+
+    Returns:
+        (process, base URL)
+    """
+    port = free_port()
+    env = dict(
+        os.environ,
+        PDF_CACHE_PATH=os.path.join(directory, "cache.sqlite3"),
+        PDF_STORE_DIR=os.path.join(directory, "store"),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=REPO_DIR, env=env, start_new_session=True
+    )
+    base_url = f"http://127.0.0.1:{port}/"
+    deadline = time.time() + 60
+    while True:
+        try:
+            urllib.request.urlopen(base_url + "metrics").read()
+            return process, base_url
+        except OSError:
+            if process.poll() is not None or time.time() > deadline:
+                process.kill()
+                raise RuntimeError("Server did not start")
+            time.sleep(0.2)
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+    # The extraction pool workers of the server are left behind otherwise
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def run_sessions(base_url, pairs, paginate, ramp_seconds, session_class=SimulatedSession):
+    """
+    Run one simulated session per PDF pair concurrently
+
+    Returns:
+        (sessions, timings by step, exceptions of the failed sessions)
+    """
+    timings = defaultdict(list)
+    sessions = [session_class(base_url, timings) for _ in pairs]
+
+    async def run(index, pair):
+        await asyncio.sleep(ramp_seconds * index / max(len(pairs), 1))
+        await sessions[index].run(*pair, paginate)
+
+    results = await asyncio.gather(
+        *(run(index, pair) for index, pair in enumerate(pairs)), return_exceptions=True
+    )
+    errors = [result for result in results if isinstance(result, BaseException)]
+    return sessions, timings, errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=10, help="concurrent simulated sessions")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--change-ratio", type=float, default=0.05, help="share of changed rows")
+    parser.add_argument("--paginate", type=int, default=5, help="pages each session moves forward")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions start")
+    parser.add_argument("--same-pair", action="store_true",
+                        help="upload the same pair in every session, exercising the caches")
+    parser.add_argument("--url", help="test a running server instead of starting one")
+    args = parser.parse_args(argv)
+
+    if websockets is None:
+        print("The load test needs the websockets package")
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        pairs = [
+            make_pair(directory, args.pages, args.change_ratio, seed=0 if args.same_pair else index)
+            for index in range(1 if args.same_pair else args.sessions)
+        ]
+        pairs = [pairs[index % len(pairs)] for index in range(args.sessions)]
+
+        process = None
+        base_url = args.url
+        if base_url is None:
+            process, base_url = start_server(directory)
+
+        try:
+            start = time.perf_counter()
+            _, timings, errors = asyncio.run(run_sessions(base_url, pairs, args.paginate, args.ramp))
+            wall_seconds = time.perf_counter() - start
+        finally:
+            if process is not None:
+                stop_server(process)
+
+    completed = args.sessions - len(errors)
+    pages_viewed = len(timings["next page"])
+    print(f"Sessions: {args.sessions}, pages per PDF: {args.pages}, change ratio: {args.change_ratio}")
+    for step in ("connect", "upload", "compare", "next page", "diff chunk"):
+        print(format_timings(step, timings[step]))
+    print(f"Completed: {completed}, failed: {len(errors)}, wall time: {wall_seconds:.2f} s")
+    print(f"Throughput: {completed / wall_seconds:.2f} sessions/s, {pages_viewed / wall_seconds:.1f} page views/s")
+    if process is not None:
+        print(f"Server peak RSS: {peak_rss_mb(resource.RUSAGE_CHILDREN):.1f} MB")
+    for error in errors[:5]:
+        print(f"Error: {error!r}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,85 @@
+"""
+Measure the memory a session keeps for one comparison, before and after
+switching pdf_results to the compact ComparisonResult
+
+Usage:
+    python benchmarks/memory_benchmark.py [pages] [lines_per_page] [changed_page_ratio]
+"""
+
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pdf_compare import ComparisonResult
+
+
+def make_documents(pages, lines_per_page, changed_page_ratio, rng):
+    """Two statement-like documents that differ on roughly changed_page_ratio of the pages"""
+    original = {}
+    comparison = {}
+    for page_num in range(1, pages + 1):
+        lines = [
+            f"ACC{rng.randrange(400):04d}  {rng.randrange(10 ** 7) / 100:>14.2f}  {rng.choice(['EUR', 'USD', 'CHF'])}"
+            if rng.random() < 0.6 else "0.00      0.00      0.00      0.00"
+            for _ in range(lines_per_page)
+        ]
+        original[page_num] = "\n".join(lines)
+        if rng.random() < changed_page_ratio:
+            lines[rng.randrange(lines_per_page)] = f"ACC9999  {rng.randrange(10 ** 7) / 100:>14.2f}  EUR"
+        comparison[page_num] = "\n".join(lines)
+    return original, comparison
+
+
+def dict_layout(original, comparison):
+    """Texts, per-page texts and all page diffs, as pdf_results used to hold them"""
+    result = ComparisonResult(original, comparison, lazy=False)
+    return {
+        "original_text": "\n".join(original.values()),
+        "comparison_text": "\n".join(comparison.values()),
+        "original_by_page": original,
+        "comparison_by_page": comparison,
+        "diff_by_page": {position: result.get(position) for position in result.changed_positions},
+        "page_pairs": result.page_pairs,
+    }
+
+
+def retained_bytes(build):
+    """Bytes still allocated after build() returns, while its result is alive"""
+    tracemalloc.start()
+    result = build()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current, peak
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    lines_per_page = int(sys.argv[2]) if len(sys.argv) > 2 else 60
+    changed_page_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    rng = random.Random(7)
+
+    def previous_layout():
+        return dict_layout(*make_documents(pages, lines_per_page, changed_page_ratio, rng))
+
+    def compact_layout(lazy):
+        def build():
+            original, comparison = make_documents(pages, lines_per_page, changed_page_ratio, rng)
+            return ComparisonResult(original, comparison, lazy=lazy)
+        return build
+
+    print(f'Pages: {pages}, lines per page: {lines_per_page}, changed page ratio: {changed_page_ratio}')
+    for label, build in (
+        ("dicts of strings", previous_layout),
+        ("ComparisonResult", compact_layout(lazy=False)),
+        ("ComparisonResult (lazy)", compact_layout(lazy=True)),
+    ):
+        current, peak = retained_bytes(build)
+        print(f'{label:>24}: retained {current / 1024:9.1f} KiB, peak {peak / 1024:9.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+"""
+Run several app workers behind a sticky proxy and check them under concurrent load
+
+Shiny sessions keep their state in the worker that serves their websocket, and
+the upload requests of a session must reach that same worker. In production
+this needs a load balancer with session affinity (e.g. nginx hashing on a
+cookie). This harness starts the workers on their own ports, sharing one
+document store and one extraction/result cache, and puts a small cookie-based
+sticky proxy in front of them. It then runs the simulated sessions of
+load_test.py through the proxy and checks that:
+
+- every session completed and saw the page count computed locally,
+- the sessions were spread over all workers,
+- PDFs registered by one worker are served by every other worker,
+- all references and tokens were released once the sessions ended.
+
+Usage:
+    python benchmarks/multi_worker.py [--workers N] [--sessions N] [--pages P] [--paginate K]
+"""
+
+from collections import Counter
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from load_test import SimulatedSession, free_port, run_sessions, start_server, stop_server, websockets
+from pdf_compare import ComparisonResult, count_pdf_pages, extract_page_range, text_normalizer
+from workload import format_timings, make_pair
+
+AFFINITY_COOKIE = "pdf_compare_worker"
+COOKIE_PATTERN = re.compile(rb"(?im)^cookie:.*\b" + AFFINITY_COOKIE.encode() + rb"=(\d+)")
+
+
+class StickyProxy:
+    """
+    Reverse proxy pinning every client to one worker with a cookie
+
+    New clients are assigned round-robin. The first response on a connection
+    without the cookie gets a Set-Cookie header, after that bytes are copied
+    unchanged in both directions, which also carries websocket traffic.
+    """
+
+    def __init__(self, backends):
+        self.backends = backends
+        self.assigned = 0
+        self.connections = Counter()
+        self.handlers = set()
+        self.writers = set()
+
+    async def handle(self, client_reader, client_writer):
+        self.handlers.add(asyncio.current_task())
+        self.writers.add(client_writer)
+        try:
+            await self.forward(client_reader, client_writer)
+        finally:
+            self.handlers.discard(asyncio.current_task())
+
+    async def forward(self, client_reader, client_writer):
+        try:
+            head = await client_reader.readuntil(b"\r\n\r\n")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            client_writer.close()
+            return
+
+        match = COOKIE_PATTERN.search(head)
+        if match and int(match.group(1)) < len(self.backends):
+            index, new_client = int(match.group(1)), False
+        else:
+            index, new_client = self.assigned % len(self.backends), True
+            self.assigned += 1
+        self.connections[index] += 1
+
+        backend_reader, backend_writer = await asyncio.open_connection(*self.backends[index])
+        self.writers.add(backend_writer)
+        backend_writer.write(head)
+        if new_client:
+            response_head = await backend_reader.readuntil(b"\r\n\r\n")
+            cookie = f"Set-Cookie: {AFFINITY_COOKIE}={index}; Path=/\r\n".encode()
+            client_writer.write(response_head[:-2] + cookie + b"\r\n")
+
+        await asyncio.gather(pipe(client_reader, backend_writer), pipe(backend_reader, client_writer))
+
+    async def close(self):
+        """Close the connections that are still open, e.g. idle keep-alive ones"""
+        for writer in self.writers:
+            writer.close()
+        if self.handlers:
+            await asyncio.wait(self.handlers, timeout=5)
+
+
+async def pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(64 * 1024)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+class CheckedSession(SimulatedSession):
+    """Simulated session that fetches its PDFs from every worker before it ends"""
+
+    backend_urls = []
+
+    async def check(self):
+        self.served_by = []
+        for url in self.viewer_urls.values():
+            for backend_url in self.backend_urls:
+                request = urllib.request.Request(backend_url + url, headers={"Range": "bytes=0-99"})
+                status = await asyncio.to_thread(lambda: urllib.request.urlopen(request).status)
+                self.served_by.append(status == 206)
+
+
+def expected_pages(original_path, comparison_path):
+    """Number of aligned pages the app should report for a pair"""
+    documents = [
+        text_normalizer.normalize_document(extract_page_range(path, 0, count_pdf_pages(path)))
+        for path in (original_path, comparison_path)
+    ]
+    return len(ComparisonResult(*documents))
+
+
+def get_json(url):
+    with urllib.request.urlopen(url) as response:
+        return json.loads(response.read())
+
+
+async def run(args, directory):
+    distinct = max(args.sessions // 2, 1)
+    pairs = [make_pair(directory, args.pages, args.change_ratio, seed) for seed in range(distinct)]
+    # Every pair is compared twice, so duplicates hit the shared store and result cache
+    pairs = [pairs[index % distinct] for index in range(args.sessions)]
+    expected = {pair: expected_pages(*pair) for pair in set(pairs)}
+
+    processes, backend_urls = [], []
+    try:
+        for _ in range(args.workers):
+            process, base_url = start_server(directory)
+            processes.append(process)
+            backend_urls.append(base_url)
+
+        proxy = StickyProxy([("127.0.0.1", int(url.rsplit(":", 1)[1].strip("/"))) for url in backend_urls])
+        port = free_port()
+        server = await asyncio.start_server(proxy.handle, "127.0.0.1", port)
+        CheckedSession.backend_urls = backend_urls
+
+        start = time.perf_counter()
+        sessions, timings, errors = await run_sessions(
+            f"http://127.0.0.1:{port}/", pairs, args.paginate, 0.0, session_class=CheckedSession
+        )
+        wall_seconds = time.perf_counter() - start
+        server.close()
+        await proxy.close()
+
+        # Sessions end asynchronously on their workers once the websockets are closed
+        deadline = time.time() + 10
+        while True:
+            stats = get_json(backend_urls[0] + "storage/stats")
+            if (stats["sessions"] == 0 and stats["tokens"] == 0) or time.time() > deadline:
+                break
+            await asyncio.sleep(0.2)
+        cache = get_json(backend_urls[-1] + "cache/stats")
+    finally:
+        for process in processes:
+            stop_server(process)
+
+    for step in ("connect", "upload", "compare", "next page", "diff chunk"):
+        print(format_timings(step, timings[step]))
+    print(f"Wall time: {wall_seconds:.2f} s, connections per worker: {dict(sorted(proxy.connections.items()))}")
+    print(f"Store: {stats}")
+    print(f"Cache: {cache}")
+
+    checks = [
+        ("all sessions completed", not errors),
+        ("page counts match", all(
+            session.max_pages == expected[pair] for session, pair in zip(sessions, pairs)
+        )),
+        ("sessions spread over all workers", len(proxy.connections) == args.workers),
+        ("PDFs served by every worker", all(
+            session.served_by and all(session.served_by) for session in sessions
+        )),
+        ("documents deduplicated", stats["documents"] == 2 * distinct),
+        ("references and tokens released", stats["sessions"] == 0 and stats["tokens"] == 0),
+    ]
+    for name, passed in checks:
+        print(f"{'PASS' if passed else 'FAIL'}: {name}")
+    for error in errors[:5]:
+        print(f"Error: {error!r}")
+    return 0 if all(passed for _, passed in checks) else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--sessions", type=int, default=16, help="concurrent simulated sessions")
+    parser.add_argument("--pages", type=int, default=20, help="pages per synthetic PDF")
+    parser.add_argument("--change-ratio", type=float, default=0.05, help="share of changed rows")
+    parser.add_argument("--paginate", type=int, default=3, help="pages each session moves forward")
+    args = parser.parse_args(argv)
+
+    if websockets is None:
+        print("The harness needs the websockets package")
+        return 1
+
+    with tempfile.TemporaryDirectory() as directory:
+        return asyncio.run(run(args, directory))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
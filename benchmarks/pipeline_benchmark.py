@@ -0,0 +1,80 @@
+"""
+Micro-benchmark the stages of the comparison path on a synthetic PDF pair
+
+Times text extraction, normalization, page alignment and diffing, intra-line
+highlighting and page rendering separately and reports p50/p95 per stage.
+Page rendering is skipped when PyMuPDF is not installed.
+
+Usage:
+    python benchmarks/pipeline_benchmark.py [pages] [change_ratio] [repeat]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from diff_engine import highlight_changes
+from pdf_compare import ComparisonResult, count_pdf_pages, extract_page_range, text_normalizer
+from workload import format_timings, make_pair, peak_rss_mb
+
+
+def timed_runs(func, repeat):
+    """Run func repeat times and return the durations and the last result"""
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def main():
+    pages = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    change_ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        original_path, comparison_path = make_pair(directory, pages, change_ratio)
+        print(f"Pages: {pages}, change ratio: {change_ratio}, runs per stage: {repeat}")
+
+        timings, (original_by_page, comparison_by_page) = timed_runs(lambda: [
+            extract_page_range(path, 0, count_pdf_pages(path)) for path in (original_path, comparison_path)
+        ], repeat)
+        print(format_timings("extract (2 documents)", timings))
+
+        timings, (original_by_page, comparison_by_page) = timed_runs(lambda: [
+            text_normalizer.normalize_document(text_by_page)
+            for text_by_page in (original_by_page, comparison_by_page)
+        ], repeat)
+        print(format_timings("normalize", timings))
+
+        for lazy in (False, True):
+            timings, comparison = timed_runs(
+                lambda: ComparisonResult(original_by_page, comparison_by_page, lazy=lazy), repeat
+            )
+            print(format_timings("compare (lazy)" if lazy else "compare (eager)", timings))
+
+        page_diffs = [comparison.get(page, []) for page in range(1, len(comparison) + 1)]
+        timings, _ = timed_runs(lambda: [highlight_changes(diff_lines) for diff_lines in page_diffs], repeat)
+        print(format_timings("highlight all pages", timings))
+
+        try:
+            from app import fitz, render_page_pixmap
+        except ImportError:
+            fitz = None
+        if fitz is None:
+            print("render page: skipped, PyMuPDF is not installed")
+        else:
+            timings, _ = timed_runs(lambda: render_page_pixmap(original_path, 1, 1.0).tobytes("png"), repeat)
+            print(format_timings("render page (100%)", timings))
+
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
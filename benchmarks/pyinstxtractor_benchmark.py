@@ -0,0 +1,160 @@
+"""
+Benchmark resources/pyinstxtractor.py on a synthetic PyInstaller archive
+
+Builds an executable-like file with a CArchive of binaries and data files and a
+PYZ archive of many modules, the layout PyInstaller 2.1+ writes, then times the
+extraction serially and with --mmap and --jobs. Every mode must produce the same
+files as the serial extraction, the benchmark fails otherwise.
+
+Usage:
+    python benchmarks/pyinstxtractor_benchmark.py [modules] [jobs] [repeat]
+"""
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources"))
+
+import pyinstxtractor
+
+from workload import format_timings, peak_rss_mb
+
+COOKIE = struct.Struct("!8siiii64s")
+TOC_ENTRY = struct.Struct("!iiiiBc")
+
+
+def module_source(index, rng):
+    """Source of a module with a few functions, the size varying between modules"""
+    functions = [
+        f"def function_{n}(value, scale={rng.randrange(100)}):\n"
+        f"    '''Function {n} of module {index}'''\n"
+        f"    result = [value * scale + {rng.randrange(10 ** 6)} for _ in range({rng.randrange(1, 50)})]\n"
+        f"    return sum(result) / len(result), {str(rng.random())!r}\n"
+        for n in range(rng.randrange(5, 60))
+    ]
+    return "\n".join(functions)
+
+
+def build_pyz(modules, rng):
+    """PYZ archive of zlib-compressed marshalled code objects, keyed by dotted module name"""
+    data = bytearray(b"PYZ\0" + importlib.util.MAGIC_NUMBER + b"\0\0\0\0")
+    # Compiling is slow, so modules reuse a pool of code objects
+    codes = [marshal.dumps(compile(module_source(i, rng), f"module_{i}", "exec")) for i in range(64)]
+    toc = []
+    for index in range(modules):
+        compressed = zlib.compress(codes[index % len(codes)] + b"%d" % index)
+        toc.append((f"package_{index % 40}.module_{index}", (0, len(data), len(compressed))))
+        data += compressed
+    toc_position = len(data)
+    data += marshal.dumps(toc)
+    data[8:12] = struct.pack("!i", toc_position)
+    return bytes(data)
+
+
+def write_archive(path, modules=5000, files=200, seed=0):
+    """Write a PyInstaller 2.1+ style executable with files binaries and a PYZ of modules"""
+    rng = random.Random(seed)
+    entries = []
+    for index in range(files):
+        if index % 4 == 0:
+            # Incompressible, like already compressed resources
+            raw = rng.randbytes(rng.randrange(1000, 200000))
+        else:
+            raw = b"".join(b"%08x " % rng.randrange(2 ** 16) for _ in range(rng.randrange(100, 40000)))
+        entries.append((f"lib/file_{index}.bin", raw, True, b"b"))
+    entries.append(("main", marshal.dumps(compile("print('main')", "main", "exec")), True, b"s"))
+    entries.append(("PYZ-00.pyz", build_pyz(modules, rng), False, b"z"))
+    pack_archive(path, entries, rng)
+
+
+def pack_archive(path, entries, rng):
+    """Write a CArchive of (name, data, compress, type code) entries behind a fake bootloader"""
+    package = bytearray()
+    toc = bytearray()
+    for name, raw, compress, kind in entries:
+        data = zlib.compress(raw) if compress else raw
+        position = len(package)
+        package += data
+        encoded = name.encode() + b"\0"
+        encoded += b"\0" * (-(TOC_ENTRY.size + len(encoded)) % 16)
+        toc += TOC_ENTRY.pack(TOC_ENTRY.size + len(encoded), position, len(data), len(raw), int(compress), kind)
+        toc += encoded
+    toc_position = len(package)
+    package += toc
+    package += COOKIE.pack(
+        pyinstxtractor.PyInstArchive.MAGIC, len(package) + COOKIE.size, toc_position, len(toc),
+        sys.version_info[0] * 10 + sys.version_info[1], b"python3.dll"
+    )
+
+    with open(path, "wb") as f:
+        # Stand-in for the bootloader the archive is appended to
+        f.write(b"MZ" + rng.randbytes(100000))
+        f.write(package)
+
+
+def extract(path, directory, use_mmap=False, jobs=1):
+    """Extract path into directory with pyinstxtractor and return the seconds it took"""
+    start = time.perf_counter()
+    with pyinstxtractor.PyInstArchive.load(path, use_mmap, jobs) as archive:
+        archive.extractFiles(directory)
+    return time.perf_counter() - start
+
+
+def tree_digest(directory):
+    """Hash of the relative paths and contents of all files below directory"""
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode() + b"\0")
+            with open(path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+def main():
+    modules = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    jobs = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count() or 4
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    modes = [
+        ("serial", False, 1),
+        ("mmap", True, 1),
+        (f"jobs={jobs}", False, jobs),
+        (f"mmap jobs={jobs}", True, jobs),
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app.exe")
+        write_archive(path, modules)
+        print(f"Modules: {modules}, archive: {os.path.getsize(path) / 2 ** 20:.1f} MB, runs per mode: {repeat}")
+
+        expected = None
+        failed = False
+        for name, use_mmap, mode_jobs in modes:
+            timings = []
+            for run in range(repeat):
+                output = os.path.join(directory, f"{name}-{run}".replace(" ", "_").replace("=", ""))
+                timings.append(extract(path, output, use_mmap, mode_jobs))
+            digest = tree_digest(output)
+            expected = expected or digest
+            if digest != expected:
+                failed = True
+            print(format_timings(name, timings) + ("" if digest == expected else "  OUTPUT DIFFERS"))
+
+    print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+"""
+Micro-benchmark parsing the CArchive table of contents in resources/pyinstxtractor.py
+
+Builds an archive with many small entries and reports the parse time and the
+memory held per entry, for parseTOC and for the former parser that read every
+entry with two small reads into a __dict__ based entry object. The name index
+parseTOC also builds is reported separately, the legacy parser had none.
+
+Usage:
+    python benchmarks/pyinstxtractor_toc_benchmark.py [entries] [repeat]
+"""
+
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from pyinstxtractor_benchmark import pack_archive, pyinstxtractor
+from workload import format_timings
+
+
+class LegacyEntry:
+    def __init__(self, position, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, name):
+        self.position = position
+        self.cmprsdDataSize = cmprsdDataSize
+        self.uncmprsdDataSize = uncmprsdDataSize
+        self.cmprsFlag = cmprsFlag
+        self.typeCmprsData = typeCmprsData
+        self.name = name
+
+
+def legacy_parse_toc(archive):
+    """The parser parseTOC replaced, without its messages"""
+    archive.fPtr.seek(archive.tableOfContentsPos, os.SEEK_SET)
+    toc_list = []
+    parsed = 0
+    while parsed < archive.tableOfContentsSize:
+        (entry_size, ) = struct.unpack("!i", archive.fPtr.read(4))
+        name_length = struct.calcsize("!iiiiBc")
+        (position, compressed_size, size, flag, kind, name) = struct.unpack(
+            "!iiiBc{0}s".format(entry_size - name_length), archive.fPtr.read(entry_size - 4)
+        )
+        name = name.decode("utf-8").rstrip("\0")
+        toc_list.append(LegacyEntry(archive.overlayPos + position, compressed_size, size, flag, kind, name))
+        parsed += entry_size
+    return toc_list
+
+
+def open_archive(path, use_mmap):
+    # Opened up to the table of contents, which is what is measured
+    archive = pyinstxtractor.PyInstArchive(path, use_mmap, verbose=False)
+    assert archive.open() and archive.checkFile() and archive.getCArchiveInfo()
+    return archive
+
+
+def measure(parse, entries, repeat):
+    """Durations of repeat runs of parse and the bytes it allocated per entry, kept alive"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    result = parse()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return samples, allocated / entries
+
+
+def index_bytes(names):
+    """Bytes held by a name -> position dict like tocIndex, without the names it shares with the entries"""
+    tracemalloc.start()
+    index = {name: position for (position, name) in enumerate(names)}
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+    return allocated
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "app.exe")
+        rng = random.Random(0)
+        pack_archive(path, [
+            (f"lib/package_{index % 100}/module_{index}.pyd", b"%d" % index, False, b"b")
+            for index in range(entries)
+        ], rng)
+        print(f"Entries: {entries}, runs per parser: {repeat}")
+
+        archive = open_archive(path, False)
+        samples, per_entry = measure(lambda: legacy_parse_toc(archive), entries, repeat)
+        print(format_timings("legacy", samples) + f"  {per_entry:6.0f} B/entry")
+        archive.close()
+
+        for name, use_mmap in (("parseTOC", False), ("parseTOC (mmap)", True)):
+            archive = open_archive(path, use_mmap)
+
+            def parse():
+                archive.parseTOC()
+                return (archive.tocList, archive.tocIndex)
+
+            samples, per_entry = measure(parse, entries, repeat)
+            # The measured figure includes the name index, report the two apart
+            index_per_entry = index_bytes([entry.name for entry in archive.tocList]) / entries
+            print(format_timings(name, samples)
+                  + f"  {per_entry - index_per_entry:6.0f} B/entry  + {index_per_entry:.0f} B/entry of name index")
+            assert len(archive.tocList) == entries
+            archive.close()
+
+
+if __name__ == "__main__":
+    main()
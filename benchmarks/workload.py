@@ -0,0 +1,162 @@
+"""
+Synthetic PDF pairs and reporting helpers shared by the benchmarks
+
+The generated documents look like the statements the tool is used for: a
+repeated header and footer with a print date and page number, account rows
+with amounts and separators. The comparison document changes, inserts and
+deletes roughly change_ratio of the rows.
+
+Usage:
+    python benchmarks/workload.py OUTPUT_DIR [pages] [change_ratio] [pairs]
+"""
+
+import math
+import os
+import random
+import resource
+import sys
+
+LINES_PER_PAGE = 60
+
+
+def pdf_string(text):
+    """Escape text for a PDF literal string"""
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path, pages):
+    """Write a minimal PDF with one line of Helvetica text per entry in each page's lines"""
+    page_ids = [4 + 2 * i for i in range(len(pages))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, lines in zip(page_ids, pages):
+        operators = ["BT", "/F1 9 Tf", "12 TL", "40 800 Td"]
+        operators.extend(f"({pdf_string(line)}) Tj T*" for line in lines)
+        operators.append("ET")
+        stream = "\n".join(operators).encode("latin-1")
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        data += b"%010d 00000 n \n" % offset
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def make_rows(num_rows, rng):
+    """Statement rows: accounts with amounts, zero rows and separators"""
+    rows = []
+    for _ in range(num_rows):
+        kind = rng.random()
+        if kind < 0.2:
+            rows.append("-" * 60)
+        elif kind < 0.4:
+            rows.append("0.00        0.00        0.00        0.00")
+        else:
+            rows.append(
+                f"ACC{rng.randrange(500):04d}  Position {rng.randrange(10000):05d}"
+                f"  {rng.randrange(10 ** 7) / 100:>14,.2f}  {rng.randrange(10 ** 5) / 100:>10,.2f}"
+            )
+    return rows
+
+
+def mutate_rows(rows, change_ratio, rng):
+    """Change, insert and delete roughly change_ratio of the rows"""
+    result = list(rows)
+    for _ in range(int(len(rows) * change_ratio)):
+        position = rng.randrange(len(result))
+        kind = rng.random()
+        if kind < 0.6:
+            result[position] = result[position].replace("0", "7", 1) + " *"
+        elif kind < 0.8:
+            result.insert(position, make_rows(1, rng)[0])
+        elif len(result) > 1:
+            del result[position]
+    return result
+
+
+def paginate(rows, title, printed):
+    """Split rows into pages with a header and footer on every page"""
+    body_lines = LINES_PER_PAGE - 3
+    chunks = [rows[i:i + body_lines] for i in range(0, len(rows), body_lines)] or [[]]
+    return [
+        [title, f"Printed {printed}"] + chunk + [f"Page {number} of {len(chunks)}"]
+        for number, chunk in enumerate(chunks, 1)
+    ]
+
+
+def make_pair(directory, pages, change_ratio, seed=0, name="statement"):
+    """
+    Write an original and a changed comparison PDF
+
+    Returns:
+        (original path, comparison path)
+    """
+    rng = random.Random(seed)
+    rows = make_rows(pages * (LINES_PER_PAGE - 3), rng)
+    changed = mutate_rows(rows, change_ratio, rng)
+
+    original_path = os.path.join(directory, f"{name}_{seed}_original.pdf")
+    comparison_path = os.path.join(directory, f"{name}_{seed}_comparison.pdf")
+    write_pdf(original_path, paginate(rows, "ACME Holdings - Client Statement", "01.03.2024 09:12"))
+    write_pdf(comparison_path, paginate(changed, "ACME Holdings - Client Statement", "02.03.2024 17:45"))
+    return original_path, comparison_path
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size in MB, of this process or of its finished children"""
+    peak = resource.getrusage(who).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def format_timings(name, samples):
+    """One report line with p50/p95 of a list of durations in seconds"""
+    return (
+        f"{name:<24} n={len(samples):<5} p50={percentile(samples, 0.5) * 1000:9.1f} ms"
+        f"  p95={percentile(samples, 0.95) * 1000:9.1f} ms"
+    )
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: workload.py OUTPUT_DIR [pages] [change_ratio] [pairs]")
+        return
+
+    directory = sys.argv[1]
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    change_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+    pairs = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+
+    os.makedirs(directory, exist_ok=True)
+    for seed in range(pairs):
+        for path in make_pair(directory, pages, change_ratio, seed):
+            print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,587 @@
+"""
+Line diff engines for the PDF comparison tool
+
+Every engine takes two lists of lines and returns SequenceMatcher-style opcodes
+(tag, i1, i2, j1, j2). `unified_diff` turns those opcodes into the same hunks
+that `difflib.unified_diff` produces, so engines can be swapped freely.
+
+Engines:
+    patience  Patience diff over interned line ids, with a linear-space Myers
+              fallback for regions without unique lines. Fast on long documents
+              with many repeated lines such as rows of zeros and separators.
+    difflib   difflib.SequenceMatcher, kept as the reference backend.
+"""
+
+import difflib
+import os
+import re
+from bisect import bisect_left
+from collections import Counter
+
+try:
+    # Vectorizes the numeric tolerance checks of the token diff
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# Edits after which a middle snake search of the Myers fallback stops and splits
+# the region at the furthest point reached, trading minimality for bounded time
+MYERS_MAX_COST = 64
+
+
+def intern_lines(a, b):
+    """Map the lines of both sequences to small integer ids shared between them"""
+    ids = {}
+    a_ids = [ids.setdefault(line, len(ids)) for line in a]
+    b_ids = [ids.setdefault(line, len(ids)) for line in b]
+    return a_ids, b_ids
+
+
+def _unique_lcs(a, b, alo, ahi, blo, bhi):
+    """
+    Longest increasing run of lines that occur exactly once in both ranges
+
+    Returns:
+        List of (i, j) anchor positions, ordered by i and j
+    """
+    a_counts = Counter(a[alo:ahi])
+    b_counts = Counter(b[blo:bhi])
+    b_positions = {b[j]: j for j in range(blo, bhi) if b_counts[b[j]] == 1}
+
+    candidates = [
+        (i, b_positions[a[i]])
+        for i in range(alo, ahi)
+        if a_counts[a[i]] == 1 and a[i] in b_positions
+    ]
+    if not candidates:
+        return []
+
+    # Patience sorting on the b positions gives the longest increasing subsequence
+    pile_tops = []
+    pile_items = []
+    back_pointers = []
+    for index, (_, j) in enumerate(candidates):
+        pile = bisect_left(pile_tops, j)
+        back_pointers.append(pile_items[pile - 1] if pile else None)
+        if pile == len(pile_tops):
+            pile_tops.append(j)
+            pile_items.append(index)
+        else:
+            pile_tops[pile] = j
+            pile_items[pile] = index
+
+    anchors = []
+    index = pile_items[-1]
+    while index is not None:
+        anchors.append(candidates[index])
+        index = back_pointers[index]
+    anchors.reverse()
+    return anchors
+
+
+def _middle_snake(a, b, alo, ahi, blo, bhi):
+    """
+    Find the middle snake of a shortest edit script between two ranges
+
+    Runs the forward and backward searches of Myers' linear-space variant until
+    they overlap. When that takes more than MYERS_MAX_COST edits, the point the
+    forward search got furthest is returned instead, which splits the problem
+    without a minimality guarantee.
+
+    Returns:
+        (x1, y1, x2, y2): the snake from (x1, y1) to (x2, y2), absolute positions
+        whose lines between the two points match
+    """
+    n = ahi - alo
+    m = bhi - blo
+    delta = n - m
+    odd = delta & 1
+    max_d = min((n + m + 1) // 2, MYERS_MAX_COST)
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[alo + x] == b[blo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+            # Backward diagonal delta - k was searched for d - 1 edits
+            if odd and -(d - 1) <= delta - k <= d - 1 and x + backward[offset + delta - k] >= n:
+                return alo + x_start, blo + y_start, alo + x, blo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            x_start, y_start = x, y
+            while x < n and y < m and a[ahi - 1 - x] == b[bhi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return ahi - x, bhi - y, ahi - x_start, bhi - y_start
+
+    # Too expensive: split at the furthest point of the forward search
+    best = None
+    for k in range(-max_d, max_d + 1, 2):
+        x = min(forward[offset + k], n)
+        y = x - k
+        if 0 <= y <= m and (best is None or x + y > best[0] + best[1]):
+            best = (x, y)
+    x, y = best
+    return alo + x, blo + y, alo + x, blo + y
+
+
+def _myers_matches(a, b, alo, ahi, blo, bhi, matches):
+    """
+    Append the matching (i, j) pairs of an edit script between two ranges
+
+    Divide and conquer on the middle snake, so memory stays linear in the size of
+    the ranges and the time of each split is bounded by MYERS_MAX_COST.
+    """
+    regions = [(alo, ahi, blo, bhi)]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        x1, y1, x2, y2 = _middle_snake(a, b, alo, ahi, blo, bhi)
+        for offset in range(x2 - x1):
+            matches.append((x1 + offset, y1 + offset))
+        regions.append((alo, x1, blo, y1))
+        regions.append((x2, ahi, y2, bhi))
+
+
+def _patience_matches(a, b):
+    """Return the sorted (i, j) pairs of matching lines between two id sequences"""
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+
+        # Common prefix and suffix
+        while alo < ahi and blo < bhi and a[alo] == b[blo]:
+            matches.append((alo, blo))
+            alo += 1
+            blo += 1
+        while alo < ahi and blo < bhi and a[ahi - 1] == b[bhi - 1]:
+            ahi -= 1
+            bhi -= 1
+            matches.append((ahi, bhi))
+
+        if alo >= ahi or blo >= bhi:
+            continue
+
+        anchors = _unique_lcs(a, b, alo, ahi, blo, bhi)
+        if not anchors:
+            _myers_matches(a, b, alo, ahi, blo, bhi, matches)
+            continue
+
+        # Diff the gaps between the anchors independently
+        prev_i, prev_j = alo, blo
+        for i, j in anchors:
+            matches.append((i, j))
+            regions.append((prev_i, i, prev_j, j))
+            prev_i, prev_j = i + 1, j + 1
+        regions.append((prev_i, ahi, prev_j, bhi))
+
+    matches.sort()
+    return matches
+
+
+def matches_to_opcodes(matches, a_len, b_len):
+    """Turn sorted matching (i, j) pairs into SequenceMatcher-style opcodes"""
+    opcodes = []
+    i = j = 0
+    for mi, mj in matches + [(a_len, b_len)]:
+        if mi > i or mj > j:
+            if mi > i and mj > j:
+                tag = 'replace'
+            elif mi > i:
+                tag = 'delete'
+            else:
+                tag = 'insert'
+            opcodes.append((tag, i, mi, j, mj))
+        if mi == a_len and mj == b_len:
+            break
+        if opcodes and opcodes[-1][0] == 'equal':
+            tag, i1, _, j1, _ = opcodes[-1]
+            opcodes[-1] = (tag, i1, mi + 1, j1, mj + 1)
+        else:
+            opcodes.append(('equal', mi, mi + 1, mj, mj + 1))
+        i, j = mi + 1, mj + 1
+    return opcodes
+
+
+def patience_opcodes(a, b):
+    """Opcodes from the patience engine"""
+    a_ids, b_ids = intern_lines(a, b)
+    return matches_to_opcodes(_patience_matches(a_ids, b_ids), len(a), len(b))
+
+
+def difflib_opcodes(a, b):
+    """Opcodes from difflib.SequenceMatcher, the reference engine"""
+    return difflib.SequenceMatcher(None, a, b).get_opcodes()
+
+
+DIFF_ENGINES = {
+    "patience": patience_opcodes,
+    "difflib": difflib_opcodes,
+}
+
+# Engine used when the caller does not pick one
+DEFAULT_DIFF_ENGINE = os.environ.get("PDF_DIFF_ENGINE", "patience")
+
+
+def group_opcodes(opcodes, n=3):
+    """Group opcodes into hunks with n lines of context, like get_grouped_opcodes"""
+    codes = list(opcodes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # End the current group and start a new one whenever there is a large range with no changes
+        if tag == 'equal' and i2 - i1 > n + n:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _format_range(start, stop):
+    """Convert a range to the "ed" format used in unified diff hunk headers"""
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f'{beginning}'
+    if not length:
+        beginning -= 1
+    return f'{beginning},{length}'
+
+
+def hunk_header(i1, i2, j1, j2, lineterm=''):
+    """Return the @@ line of a hunk covering a[i1:i2] and b[j1:j2]"""
+    return f'@@ -{_format_range(i1, i2)} +{_format_range(j1, j2)} @@{lineterm}'
+
+
+def unified_diff(a, b, fromfile='', tofile='', n=3, lineterm='', engine=None):
+    """
+    Unified diff of two lists of lines, same output format as difflib.unified_diff
+
+    Args:
+        engine: Name of an engine in DIFF_ENGINES, defaults to DEFAULT_DIFF_ENGINE
+    """
+    opcodes = DIFF_ENGINES[engine or DEFAULT_DIFF_ENGINE](a, b)
+    started = False
+    for group in group_opcodes(opcodes, n):
+        if not started:
+            started = True
+            yield f'--- {fromfile}{lineterm}'
+            yield f'+++ {tofile}{lineterm}'
+
+        first, last = group[0], group[-1]
+        yield hunk_header(first[1], last[2], first[3], last[4], lineterm)
+
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield ' ' + line
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield '-' + line
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield '+' + line
+
+
+def _hunk_lines(diff_lines):
+    """Skip the ---/+++ file header, which would be ambiguous with removed "--..." lines"""
+    in_hunk = False
+    for line in diff_lines:
+        if line.startswith('@@'):
+            in_hunk = True
+        if in_hunk:
+            yield line
+
+
+def count_changes(diff_lines):
+    """Return (added_lines, removed_lines) of a unified diff"""
+    added_lines = removed_lines = 0
+    for line in _hunk_lines(diff_lines):
+        if line.startswith('+'):
+            added_lines += 1
+        elif line.startswith('-'):
+            removed_lines += 1
+    return added_lines, removed_lines
+
+
+def changed_lines(diff_lines):
+    """Return the added and removed lines of a unified diff, with their +/- prefix"""
+    return [line for line in _hunk_lines(diff_lines) if line[:1] in ('+', '-')]
+
+
+# Numbers as printed in financial reports: 1,234.50  1.234,50  (1,234.50)  1.234,50-  -12%  1'000
+NUMBER = r"\(?[-+]?\d(?:[\d,.']*\d)?(?:-(?!\w))?\)?%?"
+TOKEN_PATTERN = re.compile(NUMBER + r"|\w+|\s+|[^\w\s]")
+NUMBER_PATTERN = re.compile(NUMBER)
+# Integer part with thousands separators: 1,234,567  1.234.567  1'234'567
+GROUPED_PATTERN = re.compile(r"[1-9]\d{0,2}([,.'])\d{3}(?:\1\d{3})*")
+
+# Limits that keep the token diff of one hunk bounded; larger hunks fall back to whole lines
+MAX_HUNK_LINE_PAIRS = 500
+MAX_LINE_TOKENS = 256
+
+
+def _plain_digits(digits):
+    """
+    Rewrite digits with separators as a float literal, or None
+
+    The last of two different separators is the decimal one, a repeated separator
+    groups thousands. A single "," or "." before exactly three digits can be either,
+    so 1,234 and 1.234 are ambiguous.
+    """
+    separators = [c for c in digits if not c.isdigit()]
+    if not separators:
+        return digits
+    decimal = separators[-1]
+    if decimal == "'" or separators.count(decimal) > 1:
+        integer, fraction = digits, ""
+    else:
+        integer, fraction = digits.rsplit(decimal, 1)
+        if len(separators) == 1 and GROUPED_PATTERN.fullmatch(digits):
+            return None
+    if not integer.isdigit():
+        if not GROUPED_PATTERN.fullmatch(integer):
+            return None
+        integer = re.sub(r"\D", "", integer)
+    return f"{integer}.{fraction}" if fraction else integer
+
+
+def parse_number(token):
+    """
+    Return the value of a number token, or None
+
+    Parentheses and a trailing minus mean negative. Tokens whose separators are
+    ambiguous give None and are compared as text.
+    """
+    if not NUMBER_PATTERN.fullmatch(token):
+        return None
+    negative = token.startswith("(") and token.endswith(")")
+    body = token.strip("()%")
+    if body.endswith("-"):
+        negative, body = True, body[:-1]
+    sign = body[0] if body[0] in "+-" else ""
+    digits = _plain_digits(body[len(sign):])
+    if digits is None:
+        return None
+    value = float(sign + digits)
+    return -value if negative else value
+
+
+def _token_offsets(tokens):
+    """Start offset of every token within its line, plus the line length"""
+    offsets = [0]
+    for token in tokens:
+        offsets.append(offsets[-1] + len(token))
+    return offsets
+
+
+def _merge_ranges(ranges):
+    """Sort and join touching [start, end) ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _change_blocks(diff_lines):
+    """Yield (removed, added) lists of line indexes for every run of -/+ lines in a unified diff"""
+    removed = []
+    added = []
+    for index, line in enumerate(diff_lines):
+        if line.startswith('@@') or line.startswith(' '):
+            if removed or added:
+                yield removed, added
+            removed, added = [], []
+        elif line.startswith('-') and not added:
+            removed.append(index)
+        elif line.startswith('-'):
+            yield removed, added
+            removed, added = [index], []
+        elif line.startswith('+'):
+            added.append(index)
+    if removed or added:
+        yield removed, added
+
+
+def highlight_changes(diff_lines, abs_tolerance=0.0, rel_tolerance=0.0):
+    """
+    Mark the changed tokens of the added and removed lines of a unified diff
+
+    Within every run of removed lines followed by added lines, the lines are paired
+    in order and diffed word by word, with numbers kept as single tokens. Numbers
+    that only changed within max(abs_tolerance, rel_tolerance * |old|) are not
+    marked; numbers like 1,234 whose separator may be decimal or grouping are
+    compared exactly. Hunks beyond MAX_HUNK_LINE_PAIRS pairs or lines beyond MAX_LINE_TOKENS
+    tokens are marked as whole lines.
+
+    Returns:
+        List of (line, ranges) for every +/- line, in diff order, where ranges are
+        [start, end) character offsets of the changed parts of the line
+    """
+    diff_lines = list(_hunk_lines(diff_lines))
+    ranges = {}
+    numeric_pairs = []   # (removed index, removed range, added index, added range)
+    old_values = []
+    new_values = []
+
+    for removed, added in _change_blocks(diff_lines):
+        pairs = min(len(removed), len(added))
+        if pairs > MAX_HUNK_LINE_PAIRS:
+            pairs = 0
+        # Unpaired lines changed as a whole
+        for index in removed[pairs:] + added[pairs:]:
+            ranges[index] = [[1, len(diff_lines[index])]]
+
+        for old_index, new_index in zip(removed[:pairs], added[:pairs]):
+            old_tokens = TOKEN_PATTERN.findall(diff_lines[old_index], 1)
+            new_tokens = TOKEN_PATTERN.findall(diff_lines[new_index], 1)
+            if len(old_tokens) > MAX_LINE_TOKENS or len(new_tokens) > MAX_LINE_TOKENS:
+                ranges[old_index] = [[1, len(diff_lines[old_index])]]
+                ranges[new_index] = [[1, len(diff_lines[new_index])]]
+                continue
+
+            old_offsets = _token_offsets(old_tokens)
+            new_offsets = _token_offsets(new_tokens)
+            old_ranges = ranges.setdefault(old_index, [])
+            new_ranges = ranges.setdefault(new_index, [])
+
+            def mark(target, offsets, tokens, first, last):
+                for k in range(first, last):
+                    if not tokens[k].isspace():
+                        target.append([offsets[k] + 1, offsets[k + 1] + 1])
+
+            matcher = difflib.SequenceMatcher(None, old_tokens, new_tokens, autojunk=False)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                if tag == 'equal':
+                    continue
+                if tag == 'replace' and i2 - i1 == j2 - j1:
+                    # Same shape: numbers are compared by value, the rest token by token
+                    for i, j in zip(range(i1, i2), range(j1, j2)):
+                        old_value = parse_number(old_tokens[i])
+                        new_value = parse_number(new_tokens[j])
+                        if old_value is not None and new_value is not None:
+                            numeric_pairs.append((
+                                old_index, [old_offsets[i] + 1, old_offsets[i + 1] + 1],
+                                new_index, [new_offsets[j] + 1, new_offsets[j + 1] + 1]
+                            ))
+                            old_values.append(old_value)
+                            new_values.append(new_value)
+                        else:
+                            mark(old_ranges, old_offsets, old_tokens, i, i + 1)
+                            mark(new_ranges, new_offsets, new_tokens, j, j + 1)
+                    continue
+                mark(old_ranges, old_offsets, old_tokens, i1, i2)
+                mark(new_ranges, new_offsets, new_tokens, j1, j2)
+
+    # One vectorized tolerance check for all numbers of the diff
+    if numeric_pairs:
+        if np is not None:
+            old_array = np.array(old_values)
+            new_array = np.array(new_values)
+            changed = np.abs(new_array - old_array) > np.maximum(abs_tolerance, rel_tolerance * np.abs(old_array))
+        else:
+            changed = [
+                abs(new - old) > max(abs_tolerance, rel_tolerance * abs(old))
+                for old, new in zip(old_values, new_values)
+            ]
+        for (old_index, old_range, new_index, new_range), is_changed in zip(numeric_pairs, changed):
+            if is_changed:
+                ranges[old_index].append(old_range)
+                ranges[new_index].append(new_range)
+
+    return [
+        (line, _merge_ranges(ranges.get(index, [])))
+        for index, line in enumerate(diff_lines)
+        if line[:1] in ('+', '-')
+    ]
+
+
+def apply_unified_diff(a, diff_lines):
+    """Apply a unified diff produced from `a` and return the resulting lines"""
+    result = []
+    position = 0
+    for line in _hunk_lines(diff_lines):
+        if line.startswith('@@'):
+            old_start = int(line.split()[1][1:].split(',')[0])
+            old_length = line.split()[1].split(',')
+            # Zero-length hunks name the line before the change
+            start = old_start if len(old_length) > 1 and old_length[1] == '0' else old_start - 1
+            result.extend(a[position:start])
+            position = start
+        elif line.startswith(' '):
+            result.append(a[position])
+            position += 1
+        elif line.startswith('-'):
+            position += 1
+        elif line.startswith('+'):
+            result.append(line[1:])
+    result.extend(a[position:])
+    return result
+
+
+def cross_check(a, b, engine=None):
+    """
+    Verify an engine against the difflib reference on one pair of inputs
+
+    The engine's diff must turn `a` into `b`. Its edit can differ from difflib's
+    (neither engine is guaranteed minimal), so the change counts are only reported.
+
+    Returns:
+        Dict with the change counts of both engines
+    """
+    diff_lines = list(unified_diff(a, b, engine=engine))
+    if apply_unified_diff(a, diff_lines) != list(b):
+        raise AssertionError(f"{engine or DEFAULT_DIFF_ENGINE} diff does not reproduce the comparison text")
+
+    reference = list(unified_diff(a, b, engine="difflib"))
+    if apply_unified_diff(a, reference) != list(b):
+        raise AssertionError("difflib diff does not reproduce the comparison text")
+
+    return {
+        "engine": count_changes(diff_lines),
+        "difflib": count_changes(reference),
+    }
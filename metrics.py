@@ -0,0 +1,230 @@
+"""
+Prometheus-style metrics and optional profiling of the PDF comparison app
+
+The metrics are kept in process and rendered in the Prometheus text format on
+the /metrics route of app.py. Setting PDF_PROFILE_DIR writes a cProfile dump of
+every HTTP request and every comparison into that directory.
+"""
+
+from contextlib import contextmanager
+import cProfile
+import functools
+import os
+import threading
+import time
+import uuid
+
+# Upper bounds of the histogram buckets, the +Inf bucket is always added
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))
+PAGES_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+SESSIONS_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return "{" + pairs + "}"
+
+
+def format_value(value):
+    return "+Inf" if value == float("inf") else repr(float(value))
+
+
+class Histogram:
+    """Cumulative histogram with optional labels, thread-safe"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets)) + (float("inf"), )
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the block, also when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        with self._lock:
+            series = {key: (list(s["counts"]), s["sum"], s["count"]) for key, s in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = key + (("le", format_value(bound)), )
+                yield f"{self.name}_bucket{format_labels(labels)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(key)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(key)} {count}"
+
+
+class Gauge:
+    """
+    Value that can go up and down
+
+    With a callback the value is read when the metrics are rendered instead.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, callback=None):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def get(self):
+        if self.callback is not None:
+            return self.callback()
+        with self._lock:
+            return self._value
+
+    def collect(self):
+        yield f"{self.name} {format_value(self.get())}"
+
+
+class MetricsRegistry:
+    """Metrics of this process, rendered in the Prometheus text exposition format"""
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets, labelnames=()):
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def gauge(self, name, documentation, callback=None):
+        return self.register(Gauge(name, documentation, callback))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                lines.append(f"# Error collecting {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "pdf_compare_stage_seconds", "Latency of the stages of the comparison pipeline",
+    LATENCY_BUCKETS, labelnames=("stage", )
+)
+page_extract_seconds = registry.histogram(
+    "pdf_compare_page_extract_seconds", "Text extraction time per page, averaged over a document",
+    LATENCY_BUCKETS
+)
+upload_bytes = registry.histogram(
+    "pdf_compare_upload_bytes", "Size of the uploaded PDFs", BYTES_BUCKETS
+)
+document_pages = registry.histogram(
+    "pdf_compare_document_pages", "Page count of the compared PDFs", PAGES_BUCKETS
+)
+active_sessions = registry.gauge(
+    "pdf_compare_active_sessions", "Shiny sessions currently connected"
+)
+session_concurrency = registry.histogram(
+    "pdf_compare_concurrent_sessions", "Active sessions observed whenever a session starts", SESSIONS_BUCKETS
+)
+
+
+def timed(stage):
+    """Decorator recording the latency of a function as a stage of the pipeline"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_seconds.time(stage=stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# cProfile dumps are only written when a directory is configured
+PROFILE_DIR = os.environ.get("PDF_PROFILE_DIR")
+
+# Only one profiler can run per process from python 3.12, where cProfile uses
+# sys.monitoring. Blocks entered while another one is profiled run unprofiled.
+_profiling_lock = threading.Lock()
+
+
+@contextmanager
+def profiled(label):
+    """Profile the block into PROFILE_DIR/<label>-<time>-<id>.prof when profiling is enabled"""
+    if not PROFILE_DIR or not _profiling_lock.acquire(blocking=False):
+        yield
+        return
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiling tool, e.g. a debugger, is already active
+        _profiling_lock.release()
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _profiling_lock.release()
+        safe_label = "".join(c if c.isalnum() else "_" for c in label).strip("_") or "request"
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(
+            PROFILE_DIR, f"{safe_label}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+        ))
+
+
+class ProfilingMiddleware:
+    """ASGI middleware profiling each HTTP request when PDF_PROFILE_DIR is set"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Websocket traffic of the Shiny sessions is long-lived and not profiled
+        if not PROFILE_DIR or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with profiled(f"{scope['method']} {scope['path']}"):
+            await self.app(scope, receive, send)
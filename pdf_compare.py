@@ -0,0 +1,1119 @@
+"""
+Extraction and diff engine of the PDF comparison tool
+
+Used by the Shiny app in app.py and, as a batch runner, from the command line:
+
+    python pdf_compare.py ORIGINAL_DIR COMPARISON_DIR -o results.jsonl --html report.html
+
+Files are paired by name across the two directories and compared in parallel.
+Every finished pair is appended to the JSON Lines output and recorded in a
+manifest, so an interrupted run picks up where it stopped when started again.
+"""
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import closing, contextmanager
+import argparse
+import difflib
+import getpass
+import hashlib
+import html
+import json
+import mmap
+import multiprocessing
+import os
+import re
+import sqlite3
+import stat
+import struct
+import sys
+import tempfile
+import threading
+import time
+import unicodedata
+import zlib
+
+import PyPDF2
+
+from diff_engine import DEFAULT_DIFF_ENGINE, DIFF_ENGINES, group_opcodes, hunk_header
+
+
+class ComparisonCancelled(Exception):
+    """Raised inside a comparison worker once the user has cancelled it"""
+
+
+class ComparisonProgress:
+    """
+    Progress counters and cancel flag shared between a session and its comparison worker
+
+    The worker thread advances the counters, the session polls them to update
+    its progress bar and sets the cancel flag from the Cancel button.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = threading.Event()
+        self.pages_done = 0
+        self.pages_total = 0
+        self.message = "Starting comparison"
+
+    def add_pages(self, pages):
+        with self._lock:
+            self.pages_total += pages
+
+    def advance(self, pages, message=None):
+        with self._lock:
+            self.pages_done += pages
+            if message:
+                self.message = message
+
+    def set_message(self, message):
+        with self._lock:
+            self.message = message
+
+    def snapshot(self):
+        """Return (pages_done, pages_total, message)"""
+        with self._lock:
+            return self.pages_done, self.pages_total, self.message
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Stop the worker if the comparison was cancelled"""
+        if self._cancelled.is_set():
+            raise ComparisonCancelled("Comparison cancelled")
+
+
+# Number of pages handed to one extraction worker at a time
+EXTRACTION_SHARD_PAGES = 8
+
+# Process pool shared by all sessions, created on first use
+extraction_pool = None
+extraction_pool_lock = threading.Lock()
+
+# Seconds between cancellation checks while waiting for a shard
+CANCEL_POLL_INTERVAL = 0.2
+
+
+def get_extraction_pool():
+    """Return the process pool used for page-sharded text extraction"""
+    global extraction_pool
+    with extraction_pool_lock:
+        if extraction_pool is None:
+            # The pool is created from a worker thread while the server runs other
+            # threads, forking then could copy a lock another thread holds into
+            # the workers. The fork server is started clean instead.
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else None
+            extraction_pool = ProcessPoolExecutor(mp_context=multiprocessing.get_context(start_method))
+    return extraction_pool
+
+
+# Size of the chunks used to copy and hash uploads
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+@contextmanager
+def open_pdf_reader(pdf_path):
+    """Open a PdfReader over a read-only memory map of a stored PDF"""
+    with open(pdf_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            yield PyPDF2.PdfReader(view)
+
+
+def hash_file(path):
+    """Return the SHA-256 of a file, read in fixed-size chunks"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(UPLOAD_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def copy_and_hash(src_path, dest_path):
+    """Copy a file in fixed-size chunks and return the SHA-256 computed in the same pass"""
+    sha256 = hashlib.sha256()
+    with open(src_path, 'rb') as src_file, open(dest_path, 'wb') as dest_file:
+        for chunk in iter(lambda: src_file.read(UPLOAD_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+            dest_file.write(chunk)
+    return sha256.hexdigest()
+
+
+def ingest_upload(upload_path, dest_path):
+    """
+    Move an uploaded file into session storage and hash it
+
+    The upload is renamed into place when both paths are on the same file system,
+    so it is never written a second time. Otherwise it is copied in chunks.
+
+    Returns:
+        SHA-256 of the stored file
+    """
+    try:
+        os.replace(upload_path, dest_path)
+    except OSError:
+        # Different file system: stream it across, hashing while copying
+        return copy_and_hash(upload_path, dest_path)
+    return hash_file(dest_path)
+
+
+def count_pdf_pages(pdf_path):
+    """Return the number of pages of a PDF"""
+    with open_pdf_reader(pdf_path) as pdf_reader:
+        return len(pdf_reader.pages)
+
+
+def extract_page_range(pdf_path, first_page, last_page):
+    """
+    Extract the text of pages [first_page, last_page) of a PDF
+
+    Runs in a worker process, so every call opens its own PdfReader.
+
+    Returns:
+        Dict of non-empty page text keyed by 1-based page number
+    """
+    text_by_page = {}
+    with open_pdf_reader(pdf_path) as pdf_reader:
+        for page_num in range(first_page, last_page):
+            text = pdf_reader.pages[page_num].extract_text()
+            if text:  # Only add non-empty text
+                text_by_page[page_num + 1] = text
+    return text_by_page
+
+
+def submit_extraction(pdf_path, executor):
+    """
+    Split a PDF into page shards and submit them to the executor, in page order
+
+    Returns:
+        List of (page_count, future) tuples, one per shard
+    """
+    num_pages = count_pdf_pages(pdf_path)
+    shards = []
+    for first_page in range(0, num_pages, EXTRACTION_SHARD_PAGES):
+        last_page = min(first_page + EXTRACTION_SHARD_PAGES, num_pages)
+        shards.append((
+            last_page - first_page,
+            executor.submit(extract_page_range, pdf_path, first_page, last_page)
+        ))
+    return shards
+
+
+def collect_extraction(shards, progress=None):
+    """Combine the page shards of one PDF into (text, text_by_page)"""
+    text_by_page = {}
+    for page_count, future in shards:
+        if progress is not None:
+            # Wait in short slices so a cancelled comparison stops promptly
+            while not wait([future], timeout=CANCEL_POLL_INTERVAL).done:
+                progress.check()
+            progress.advance(page_count, "Extracting text")
+        text_by_page.update(future.result())
+    return "\n".join(text_by_page.values()), text_by_page
+
+
+def extract_texts_parallel(pdf_paths, executor=None, progress=None):
+    """
+    Extract the text of several PDFs at the same time
+
+    The shards of all documents are submitted before any result is awaited,
+    so both documents of a comparison are extracted concurrently.
+
+    Args:
+        progress: Optional ComparisonProgress advanced per shard and checked for cancellation
+
+    Returns:
+        List of (text, text_by_page) tuples in the order of pdf_paths
+    """
+    executor = executor or get_extraction_pool()
+    jobs = [submit_extraction(pdf_path, executor) for pdf_path in pdf_paths]
+    if progress is not None:
+        progress.add_pages(sum(page_count for shards in jobs for page_count, _ in shards))
+
+    try:
+        return [collect_extraction(shards, progress) for shards in jobs]
+    except ComparisonCancelled:
+        # Drop the shards that have not started yet
+        for shards in jobs:
+            for _, future in shards:
+                future.cancel()
+        raise
+
+
+# Bump the suffix whenever the extraction output changes so old entries are not reused
+EXTRACTOR_VERSION = f"PyPDF2-{PyPDF2.__version__}-1"
+
+
+class ExtractionCache:
+    """
+    Persistent, size-bounded cache of extracted page text
+
+    Entries are keyed by the SHA-256 of the uploaded PDF and the extractor version,
+    plus the normalization config for normalized text, and stored zlib-compressed
+    in SQLite, so the cache is shared by all sessions and worker processes. It
+    also keeps the comparison results of PDF pairs, keyed by both hashes. The
+    least recently used entries are evicted once the stored size exceeds max_bytes.
+
+    Hits and misses are counted per kind of lookup: extracted text, normalized
+    text and comparison results.
+    """
+
+    LOOKUP_KINDS = ("text", "normalized", "result")
+
+    def __init__(self, path, max_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                "size INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [(f"{kind}_{outcome}",) for kind in self.LOOKUP_KINDS for outcome in ("hits", "misses")]
+                + [("evictions",)]
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits when the block succeeds and is closed afterwards"""
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            with conn:
+                yield conn
+
+    @staticmethod
+    def make_key(sha256, variant=None):
+        key = f"{sha256}:{EXTRACTOR_VERSION}"
+        return f"{key}:{variant}" if variant else key
+
+    def get(self, sha256, variant=None):
+        """
+        Return the cached text_by_page for a PDF hash, or None on a miss
+
+        Args:
+            variant: Optional name of a derived form of the text, e.g. a normalization config
+        """
+        data = self._load(self.make_key(sha256, variant), "normalized" if variant else "text")
+        if data is None:
+            return None
+        pages = json.loads(data)
+        # JSON object keys are strings, page numbers are ints everywhere else
+        return {int(page_num): text for page_num, text in pages.items()}
+
+    def put(self, sha256, text_by_page, variant=None):
+        """Store the text_by_page of a PDF and evict old entries beyond max_bytes"""
+        self._store(self.make_key(sha256, variant), json.dumps(text_by_page).encode("utf-8"))
+
+    @staticmethod
+    def make_result_key(original_sha256, comparison_sha256, variant):
+        return f"result:{original_sha256}:{comparison_sha256}:{EXTRACTOR_VERSION}:{variant}"
+
+    def get_result(self, original_sha256, comparison_sha256, variant):
+        """
+        Return the cached ComparisonResult of a pair of PDFs, or None on a miss
+
+        Args:
+            variant: Name of the normalization, diff engine and mode the result was computed with
+        """
+        data = self._load(self.make_result_key(original_sha256, comparison_sha256, variant), "result")
+        if data is None:
+            return None
+        # Never unpickled: the cache file may be writable by other local users
+        try:
+            return ComparisonResult.from_bytes(data)
+        except (ValueError, KeyError, TypeError, struct.error):
+            return None
+
+    def put_result(self, original_sha256, comparison_sha256, variant, result):
+        """Store a ComparisonResult so every worker can reuse it for the same pair of PDFs"""
+        self._store(
+            self.make_result_key(original_sha256, comparison_sha256, variant),
+            result.to_bytes()
+        )
+
+    def _load(self, key, kind):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (f"{kind}_misses",))
+                return None
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            conn.execute("UPDATE counters SET value = value + 1 WHERE name = ?", (f"{kind}_hits",))
+        return zlib.decompress(row[0])
+
+    def _store(self, key, data):
+        data = zlib.compress(data)
+        if len(data) > self.max_bytes:
+            return
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, len(data), time.time())
+            )
+            (total_size, ) = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()
+            if total_size <= self.max_bytes:
+                return
+
+            evicted = 0
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total_size <= self.max_bytes:
+                    break
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total_size -= size
+                evicted += 1
+            conn.execute("UPDATE counters SET value = value + ? WHERE name = 'evictions'", (evicted,))
+
+    def stats(self):
+        """
+        Return the eviction counter, the current size of the cache and the hits,
+        misses and hit ratio of each kind of lookup. The top-level hit_ratio is
+        that of extracted text.
+        """
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            entries, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries"
+            ).fetchone()
+
+        lookups = {}
+        for kind in self.LOOKUP_KINDS:
+            hits, misses = counters[f"{kind}_hits"], counters[f"{kind}_misses"]
+            lookups[kind] = {
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            }
+        return {
+            "evictions": counters["evictions"],
+            "entries": entries,
+            "size_bytes": size,
+            "max_bytes": self.max_bytes,
+            "hit_ratio": lookups["text"]["hit_ratio"],
+            "lookups": lookups,
+        }
+
+
+def private_directory(path):
+    """
+    Create a directory only the current user can access, or check an existing one
+
+    Anyone can create files in the temp directory, so a directory there that
+    another user created first must not be used for stored documents or cached
+    results.
+
+    Raises:
+        PermissionError: If the directory is a symlink or belongs to another user
+    """
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.lstat(path)
+    if not stat.S_ISDIR(info.st_mode) or (hasattr(os, "getuid") and info.st_uid != os.getuid()):
+        raise PermissionError(f"{path} is not a directory owned by the current user")
+    if info.st_mode & 0o077:
+        os.chmod(path, 0o700)
+    return path
+
+
+# Default location of the cache and the app's document store, shared by the workers of one user
+STATE_DIR = os.path.join(tempfile.gettempdir(), f"pdf_compare-{getpass.getuser()}")
+
+extraction_cache = ExtractionCache(
+    os.environ.get("PDF_CACHE_PATH") or os.path.join(private_directory(STATE_DIR), "extraction_cache.sqlite3"),
+    int(os.environ.get("PDF_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+)
+
+
+# Text normalization applied to every page before hashing and diffing. The
+# steps are named so the pipeline can be configured via PDF_NORMALIZATION
+NORMALIZATION_STEPS = ("nfkc", "hyphenation", "dates", "page_numbers", "whitespace", "headers")
+# A print timestamp repeats verbatim on the pages of a document and is stripped
+# with the headers anyway, "dates" is only needed when it differs between pages
+DEFAULT_NORMALIZATION_STEPS = ("nfkc", "hyphenation", "page_numbers", "whitespace", "headers")
+NORMALIZATION_VERSION = 3
+HEADER_ZONE_LINES = 3
+HEADER_MIN_PAGES = 3
+HEADER_PAGE_RATIO = 0.6
+
+DATE_PATTERNS = (
+    r"\b\d{4}-\d{1,2}-\d{1,2}\b",
+    r"\b\d{1,2}[./-]\d{1,2}[./-]\d{2,4}\b",
+    r"\b\d{1,2}\.?\s+(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{4}\b",
+    r"\b(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\.?\s+\d{1,2},?\s+\d{4}\b",
+    r"\b\d{1,2}:\d{2}(?::\d{2})?(?:\s*[AaPp][Mm])?\b",
+)
+PAGE_NUMBER_PATTERNS = (
+    r"^[ \t]*(?:page|p\.|seite)[ \t]*\d+(?:[ \t]*(?:of|/|von)[ \t]*\d+)?[ \t]*$",
+    r"^[ \t]*\d+[ \t]*(?:of|/|von)[ \t]*\d+[ \t]*$",
+    r"^[ \t]*[-\u2013\u2014][ \t]*\d+[ \t]*[-\u2013\u2014][ \t]*$",
+)
+
+
+class TextNormalizer:
+    """
+    Compiled, configurable normalization pipeline for extracted page text
+
+    Removes the extraction noise that shows up as spurious changes: ligatures and
+    other compatibility characters (NFKC), words hyphenated across line breaks,
+    page numbers, runs of whitespace and header/footer lines that repeat on most
+    pages. The optional "dates" step ignores dates and times when header and
+    footer lines are compared, for headers whose timestamp differs between pages.
+    The text itself keeps every date: a changed date in the page body is content
+    and must be reported.
+    """
+
+    def __init__(self, steps=DEFAULT_NORMALIZATION_STEPS, date_patterns=DATE_PATTERNS,
+                 page_number_patterns=PAGE_NUMBER_PATTERNS):
+        unknown = set(steps) - set(NORMALIZATION_STEPS)
+        if unknown:
+            raise ValueError(f"Unknown normalization steps: {', '.join(sorted(unknown))}")
+        self.steps = frozenset(steps)
+        # Letters only on both sides, a trailing minus of an amount is not a hyphen
+        self._hyphenation = re.compile(r"([^\W\d_])-\n([^\W\d_])")
+        self._dates = re.compile("|".join(f"(?:{pattern})" for pattern in date_patterns), re.IGNORECASE)
+        self._page_numbers = re.compile(
+            "|".join(f"(?:{pattern})" for pattern in page_number_patterns), re.IGNORECASE | re.MULTILINE
+        )
+        self._whitespace = re.compile(r"[^\S\n]+")
+        # Cache entries of different configurations must not be mixed up
+        patterns = "\n".join((self._dates.pattern, self._page_numbers.pattern))
+        digest = hashlib.sha1(patterns.encode("utf-8")).hexdigest()[:8]
+        self.cache_key = f"norm{NORMALIZATION_VERSION}-{'+'.join(sorted(self.steps))}-{digest}"
+
+    def normalize_page(self, text):
+        """Normalize the text of a single page, without the cross-page header/footer step"""
+        if "nfkc" in self.steps:
+            text = unicodedata.normalize("NFKC", text)
+        if "hyphenation" in self.steps:
+            text = self._hyphenation.sub(r"\1\2", text)
+        if "page_numbers" in self.steps:
+            text = self._page_numbers.sub("", text)
+        if "whitespace" in self.steps:
+            text = self._whitespace.sub(" ", text)
+        lines = (line.strip() for line in text.splitlines())
+        return "\n".join(line for line in lines if line)
+
+    def header_key(self, line):
+        """Line as compared when looking for repeated headers and footers, with dates masked"""
+        return self._dates.sub("<DATE>", line) if "dates" in self.steps else line
+
+    def repeated_lines(self, lines_by_page):
+        """Lines found in the header or footer zone of most pages"""
+        if len(lines_by_page) < HEADER_MIN_PAGES:
+            return set()
+        counts = Counter()
+        for lines in lines_by_page:
+            counts.update(set(lines[:HEADER_ZONE_LINES] + lines[-HEADER_ZONE_LINES:]))
+        min_pages = max(HEADER_MIN_PAGES, HEADER_PAGE_RATIO * len(lines_by_page))
+        return {line for line, count in counts.items() if count >= min_pages}
+
+    def normalize_document(self, text_by_page):
+        """
+        Normalize every page of a document
+
+        Returns:
+            Dictionary mapping page numbers to normalized text
+        """
+        normalized = {page_num: self.normalize_page(text) for page_num, text in text_by_page.items()}
+        if "headers" not in self.steps:
+            return normalized
+
+        lines_by_page = {page_num: text.splitlines() for page_num, text in normalized.items()}
+        repeated = self.repeated_lines([
+            [self.header_key(line) for line in lines[:HEADER_ZONE_LINES] + lines[-HEADER_ZONE_LINES:]]
+            for lines in lines_by_page.values()
+        ])
+        if not repeated:
+            return normalized
+
+        for page_num, lines in lines_by_page.items():
+            # Only strip repeated lines at the top and bottom of the page, the
+            # same text in the body is content
+            start, end = 0, len(lines)
+            while start < min(end, HEADER_ZONE_LINES) and self.header_key(lines[start]) in repeated:
+                start += 1
+            while end > max(start, len(lines) - HEADER_ZONE_LINES) and self.header_key(lines[end - 1]) in repeated:
+                end -= 1
+            normalized[page_num] = "\n".join(lines[start:end])
+        return normalized
+
+
+text_normalizer = TextNormalizer(
+    [step.strip() for step in os.environ.get("PDF_NORMALIZATION", ",".join(DEFAULT_NORMALIZATION_STEPS)).split(",")
+     if step.strip()]
+)
+
+
+def normalize_document_cached(sha256, text_by_page, normalizer=None):
+    """Normalize the per-page text of a PDF, using the extraction cache"""
+    normalizer = normalizer or text_normalizer
+    normalized = extraction_cache.get(sha256, normalizer.cache_key)
+    if normalized is None:
+        normalized = normalizer.normalize_document(text_by_page)
+        extraction_cache.put(sha256, normalized, normalizer.cache_key)
+    return normalized
+
+
+def normalize_page_text(text):
+    """Normalize page text before hashing: drop trailing whitespace and blank lines"""
+    lines = (line.rstrip() for line in text.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def page_fingerprints(text_by_page, num_pages):
+    """Return the SHA-1 digest of the normalized text of pages 1..num_pages"""
+    return [
+        hashlib.sha1(normalize_page_text(text_by_page.get(page_num, "")).encode("utf-8")).digest()
+        for page_num in range(1, num_pages + 1)
+    ]
+
+
+def align_pages(original_hashes, comparison_hashes):
+    """
+    Pair the pages of two documents by fingerprint
+
+    Identical pages are matched even when pages were inserted or deleted in between,
+    instead of always pairing page N with page N.
+
+    Returns:
+        List of (original_page, comparison_page, changed) tuples with 1-based page
+        numbers; a page without a counterpart has None on the other side
+    """
+    matcher = difflib.SequenceMatcher(None, original_hashes, comparison_hashes, autojunk=False)
+    page_pairs = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            page_pairs.extend((i + 1, j + 1, False) for i, j in zip(range(i1, i2), range(j1, j2)))
+            continue
+        # Replaced pages are paired in order, the leftovers are insertions or deletions
+        for k in range(max(i2 - i1, j2 - j1)):
+            page_pairs.append((
+                i1 + k + 1 if i1 + k < i2 else None,
+                j1 + k + 1 if j1 + k < j2 else None,
+                True
+            ))
+    return page_pairs
+
+
+def align_documents(original_by_page, comparison_by_page):
+    """Fingerprint the pages of both documents and return the aligned page_pairs"""
+    original_pages = max(original_by_page.keys(), default=0)
+    comparison_pages = max(comparison_by_page.keys(), default=0)
+    return align_pages(
+        page_fingerprints(original_by_page, original_pages),
+        page_fingerprints(comparison_by_page, comparison_pages)
+    )
+
+
+# Compute per-page diffs on demand instead of for the whole document up front
+LAZY_PAGE_DIFFS = os.environ.get("PDF_LAZY_DIFFS", "1") == "1"
+
+
+
+def result_variant(lazy=LAZY_PAGE_DIFFS):
+    """Name of the settings a ComparisonResult depends on, part of its cache key"""
+    return (
+        f"v{COMPARISON_RESULT_VERSION}:{text_normalizer.cache_key}:{DEFAULT_DIFF_ENGINE}:"
+        f"{'lazy' if lazy else 'eager'}"
+    )
+
+
+# Layout of a serialized ComparisonResult, bumped when its attributes change
+COMPARISON_RESULT_VERSION = 3
+
+# Maximum number of cells of the change heat strip, long documents share cells
+HEAT_STRIP_CELLS = 200
+
+# Number of page diffs each session keeps memoized
+PAGE_DIFF_MEMO_SIZE = 32
+
+# Number of pages on either side of the current page diffed in the background
+PAGE_DIFF_PREFETCH = 2
+
+# Threads shared by all sessions for prefetching page diffs
+prefetch_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="page-diff-prefetch")
+
+
+# Op codes of the compact diff arrays kept by ComparisonResult
+OP_HUNK, OP_EQUAL, OP_DELETE, OP_INSERT = 0, 1, 2, 3
+
+
+class LineTable:
+    """Every distinct line of a comparison stored once and referenced by integer id"""
+
+    __slots__ = ("lines", "_ids")
+
+    def __init__(self):
+        self.lines = []
+        self._ids = {}
+
+    def intern(self, text):
+        """Return the line ids of a page's text as a compact array"""
+        ids = array("I")
+        for line in text.splitlines():
+            line_id = self._ids.get(line)
+            if line_id is None:
+                line_id = self._ids[line] = len(self.lines)
+                self.lines.append(line)
+            ids.append(line_id)
+        return ids
+
+    def freeze(self):
+        """Drop the lookup dict once both documents are interned"""
+        self._ids = None
+
+
+class ComparisonResult:
+    """
+    Compact result of comparing two documents page by page
+
+    The pages of both documents are kept as arrays of ids into one shared
+    LineTable, so a line that occurs in both documents (or on many pages) is
+    stored once and the extracted texts can be dropped. The diff of a page is
+    kept as a flat int array of (op, original_line, comparison_line) triples,
+    where the line numbers are positions within the page and -1 means none;
+    every hunk starts with an OP_HUNK triple holding its first positions.
+
+    Behaves like the diff_by_page dict for lookups: get(position) renders the
+    unified diff lines of a page on demand. In lazy mode the diff arrays are
+    computed the first time a page is viewed and only the most recently used
+    max_entries are kept; otherwise all of them are computed up front.
+
+    The positions of the changed pages are kept sorted with their number of
+    changed lines, so the next or previous change is found by bisection. In
+    lazy mode that number is the size of the multiset difference of the two
+    pages' lines, a lower bound of the diff that is cheap to compute.
+    """
+
+    __slots__ = (
+        "page_pairs", "lines", "original_pages", "comparison_pages", "lazy",
+        "max_entries", "added_lines", "removed_lines", "changed_positions", "change_counts",
+        "_ops", "_lock",
+    )
+
+    def __init__(self, original_by_page, comparison_by_page, lazy=True, progress=None,
+                 max_entries=PAGE_DIFF_MEMO_SIZE):
+        self.page_pairs = align_documents(original_by_page, comparison_by_page)
+        self.lines = LineTable()
+        self.original_pages = [
+            self.lines.intern(original_by_page.get(page_num, ""))
+            for page_num in range(1, max(original_by_page.keys(), default=0) + 1)
+        ]
+        self.comparison_pages = [
+            self.lines.intern(comparison_by_page.get(page_num, ""))
+            for page_num in range(1, max(comparison_by_page.keys(), default=0) + 1)
+        ]
+        self.lines.freeze()
+
+        self.lazy = lazy
+        self.max_entries = max_entries
+        self.added_lines = self.removed_lines = None if lazy else 0
+        self.changed_positions = array("I")
+        self.change_counts = array("I")
+        self._ops = OrderedDict()
+        self._lock = threading.Lock()
+
+        for position, (orig_page, comp_page, changed) in enumerate(self.page_pairs, start=1):
+            if not changed:
+                continue
+            if lazy:
+                count = self._estimate_changes(orig_page, comp_page)
+            else:
+                if progress is not None:
+                    progress.check()
+                ops = self._diff_ops(position)
+                self._ops[position] = ops
+                added, removed = ops[::3].count(OP_INSERT), ops[::3].count(OP_DELETE)
+                self.added_lines += added
+                self.removed_lines += removed
+                count = added + removed
+            # Pages that only differ in line order still count as changed
+            self.changed_positions.append(position)
+            self.change_counts.append(max(count, 1))
+
+    def __len__(self):
+        return len(self.page_pairs)
+
+    def to_bytes(self):
+        """
+        Serialize for the shared result cache as a JSON header followed by the raw
+        data of the line id and op arrays, a format that cannot execute code
+        """
+        arrays = self.original_pages + self.comparison_pages + [self.changed_positions, self.change_counts]
+        arrays.extend(self._ops.values())
+        header = json.dumps({
+            "format": [sys.byteorder, array("I").itemsize, array("i").itemsize],
+            "page_pairs": self.page_pairs,
+            "lines": self.lines.lines,
+            "original_pages": len(self.original_pages),
+            "comparison_pages": len(self.comparison_pages),
+            "op_positions": list(self._ops),
+            "array_lengths": [len(values) for values in arrays],
+            "lazy": self.lazy,
+            "max_entries": self.max_entries,
+            "added_lines": self.added_lines,
+            "removed_lines": self.removed_lines,
+        }).encode("utf-8")
+        return struct.pack("!I", len(header)) + header + b"".join(values.tobytes() for values in arrays)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Rebuild a result from to_bytes, or None if it was written on a platform with other array layouts"""
+        (header_size, ) = struct.unpack_from("!I", data)
+        header = json.loads(data[4:4 + header_size].decode("utf-8"))
+        if header["format"] != [sys.byteorder, array("I").itemsize, array("i").itemsize]:
+            return None
+
+        num_pages = header["original_pages"] + header["comparison_pages"]
+        typecodes = ["I"] * (num_pages + 2) + ["i"] * len(header["op_positions"])
+        arrays = []
+        offset = 4 + header_size
+        for typecode, length in zip(typecodes, header["array_lengths"]):
+            values = array(typecode)
+            values.frombytes(data[offset:offset + length * values.itemsize])
+            offset += length * values.itemsize
+            arrays.append(values)
+
+        result = cls.__new__(cls)
+        result.page_pairs = [tuple(pair) for pair in header["page_pairs"]]
+        result.lines = LineTable()
+        result.lines.lines = header["lines"]
+        result.lines.freeze()
+        result.original_pages = arrays[:header["original_pages"]]
+        result.comparison_pages = arrays[header["original_pages"]:num_pages]
+        result.changed_positions, result.change_counts = arrays[num_pages:num_pages + 2]
+        result._ops = OrderedDict(zip(header["op_positions"], arrays[num_pages + 2:]))
+        for name in ("lazy", "max_entries", "added_lines", "removed_lines"):
+            setattr(result, name, header[name])
+        result._lock = threading.Lock()
+        return result
+
+    def _page_ids(self, pages, page_num):
+        return pages[page_num - 1] if page_num else array("I")
+
+    def _estimate_changes(self, orig_page, comp_page):
+        original = Counter(self._page_ids(self.original_pages, orig_page))
+        comparison = Counter(self._page_ids(self.comparison_pages, comp_page))
+        return sum((original - comparison).values()) + sum((comparison - original).values())
+
+    def next_change(self, position):
+        """Position of the first changed page after position, or None"""
+        index = bisect_right(self.changed_positions, position)
+        return self.changed_positions[index] if index < len(self.changed_positions) else None
+
+    def previous_change(self, position):
+        """Position of the last changed page before position, or None"""
+        index = bisect_left(self.changed_positions, position)
+        return self.changed_positions[index - 1] if index else None
+
+    def heat_strip(self, cells=HEAT_STRIP_CELLS):
+        """
+        Summarize the changes of the whole document in at most `cells` cells
+
+        Returns:
+            List of (first position, last position, first changed position or None,
+            changed lines) tuples, one per cell
+        """
+        total = len(self.page_pairs)
+        cells = min(cells, total)
+        strip = []
+        for cell in range(cells):
+            first = cell * total // cells + 1
+            last = (cell + 1) * total // cells
+            lo = bisect_left(self.changed_positions, first)
+            hi = bisect_right(self.changed_positions, last)
+            first_change = self.changed_positions[lo] if lo < hi else None
+            strip.append((first, last, first_change, sum(self.change_counts[lo:hi])))
+        return strip
+
+    def _diff_ops(self, position):
+        """Diff one aligned page pair into the compact op array"""
+        orig_page, comp_page, _ = self.page_pairs[position - 1]
+        original_ids = self._page_ids(self.original_pages, orig_page)
+        comparison_ids = self._page_ids(self.comparison_pages, comp_page)
+
+        ops = array("i")
+        opcodes = DIFF_ENGINES[DEFAULT_DIFF_ENGINE](original_ids, comparison_ids)
+        for group in group_opcodes(opcodes):
+            ops.extend((OP_HUNK, group[0][1], group[0][3]))
+            for tag, i1, i2, j1, j2 in group:
+                if tag == 'equal':
+                    for offset in range(i2 - i1):
+                        ops.extend((OP_EQUAL, i1 + offset, j1 + offset))
+                    continue
+                if tag in ('replace', 'delete'):
+                    for i in range(i1, i2):
+                        ops.extend((OP_DELETE, i, -1))
+                if tag in ('replace', 'insert'):
+                    for j in range(j1, j2):
+                        ops.extend((OP_INSERT, -1, j))
+        return ops
+
+    def diff_ops(self, position):
+        """Return the op array of the page at a 1-based position, computing it if needed"""
+        with self._lock:
+            if position in self._ops:
+                self._ops.move_to_end(position)
+                return self._ops[position]
+
+        ops = self._diff_ops(position)
+
+        with self._lock:
+            self._ops[position] = ops
+            self._ops.move_to_end(position)
+            while self.lazy and len(self._ops) > self.max_entries:
+                self._ops.popitem(last=False)
+        return ops
+
+    def get(self, position, default=None):
+        """Return the unified diff lines of the page at a 1-based position"""
+        if not 1 <= position <= len(self.page_pairs):
+            return default
+
+        orig_page, comp_page, changed = self.page_pairs[position - 1]
+        if not changed:
+            return []
+        ops = self.diff_ops(position)
+        if not ops:
+            return []
+
+        original_ids = self._page_ids(self.original_pages, orig_page)
+        comparison_ids = self._page_ids(self.comparison_pages, comp_page)
+        table = self.lines.lines
+        diff_lines = [f'--- Original Page {orig_page or "-"}', f'+++ Comparison Page {comp_page or "-"}']
+        hunk_index = None
+        for index in range(0, len(ops), 3):
+            op, i, j = ops[index], ops[index + 1], ops[index + 2]
+            if op == OP_HUNK:
+                # Patched with the hunk lengths once the hunk is complete
+                hunk_index = len(diff_lines)
+                diff_lines.append((i, i, j, j))
+                continue
+            i1, i2, j1, j2 = diff_lines[hunk_index]
+            if op == OP_EQUAL:
+                diff_lines.append(' ' + table[original_ids[i]])
+                diff_lines[hunk_index] = (i1, i2 + 1, j1, j2 + 1)
+            elif op == OP_DELETE:
+                diff_lines.append('-' + table[original_ids[i]])
+                diff_lines[hunk_index] = (i1, i2 + 1, j1, j2)
+            else:
+                diff_lines.append('+' + table[comparison_ids[j]])
+                diff_lines[hunk_index] = (i1, i2, j1, j2 + 1)
+
+        return [hunk_header(*line) if isinstance(line, tuple) else line for line in diff_lines]
+
+    def prefetch(self, position, radius=PAGE_DIFF_PREFETCH):
+        """Diff the changed pages around a position in the background"""
+        for neighbour in range(position - radius, position + radius + 1):
+            if neighbour == position or not 1 <= neighbour <= len(self.page_pairs):
+                continue
+            if not self.page_pairs[neighbour - 1][2]:
+                continue
+            with self._lock:
+                if neighbour in self._ops:
+                    continue
+            prefetch_pool.submit(self.diff_ops, neighbour)
+
+
+def extract_pdf(pdf_path):
+    """Extract the normalized per-page text of a PDF in the calling process, using the extraction cache"""
+    sha256 = hash_file(pdf_path)
+    text_by_page = extraction_cache.get(sha256)
+    if text_by_page is None:
+        text_by_page = extract_page_range(pdf_path, 0, count_pdf_pages(pdf_path))
+        extraction_cache.put(sha256, text_by_page)
+    return normalize_document_cached(sha256, text_by_page)
+
+
+def compare_files(name, original_path, comparison_path, include_diffs=False):
+    """
+    Compare one pair of PDFs, runs in a worker process of the batch runner
+
+    Returns:
+        JSON-serializable record of the comparison
+    """
+    start = time.perf_counter()
+    record = {"name": name, "original": original_path, "comparison": comparison_path}
+    try:
+        original_by_page = extract_pdf(original_path)
+        comparison_by_page = extract_pdf(comparison_path)
+        comparison = ComparisonResult(original_by_page, comparison_by_page, lazy=False)
+    except Exception as e:
+        record.update({"status": "error", "error": str(e), "seconds": time.perf_counter() - start})
+        return record
+
+    changed_pages = []
+    for position in comparison.changed_positions:
+        orig_page, comp_page, _ = comparison.page_pairs[position - 1]
+        ops = comparison.diff_ops(position)
+        changed_pages.append({
+            "position": position,
+            "original_page": orig_page,
+            "comparison_page": comp_page,
+            "added_lines": ops[::3].count(OP_INSERT),
+            "removed_lines": ops[::3].count(OP_DELETE),
+        })
+
+    record.update({
+        "status": "ok",
+        "pages": len(comparison),
+        "added_lines": comparison.added_lines,
+        "removed_lines": comparison.removed_lines,
+        "changed_pages": changed_pages,
+        "seconds": time.perf_counter() - start,
+    })
+    if include_diffs:
+        record["diffs"] = {str(position): comparison.get(position) for position in comparison.changed_positions}
+    return record
+
+
+def pair_files(original_dir, comparison_dir):
+    """
+    Pair the PDFs of two directories by file name
+
+    Returns:
+        (pairs, unmatched) where pairs is a sorted list of (name, original_path,
+        comparison_path) and unmatched lists names found in only one directory
+    """
+    def pdfs(directory):
+        return {
+            file_name: os.path.join(directory, file_name)
+            for file_name in os.listdir(directory)
+            if file_name.lower().endswith(".pdf")
+        }
+
+    originals = pdfs(original_dir)
+    comparisons = pdfs(comparison_dir)
+    pairs = [(name, originals[name], comparisons[name]) for name in sorted(originals.keys() & comparisons.keys())]
+    unmatched = sorted(originals.keys() ^ comparisons.keys())
+    return pairs, unmatched
+
+
+def load_manifest(manifest_path):
+    """Return the names of the pairs a previous run has completed"""
+    if not os.path.exists(manifest_path):
+        return set()
+    with open(manifest_path, encoding="utf-8") as manifest:
+        return {line.rstrip("\n") for line in manifest if line.strip()}
+
+
+def load_records(jsonl_path):
+    """Return the latest record per pair name from a JSON Lines results file"""
+    records = {}
+    with open(jsonl_path, encoding="utf-8") as results:
+        for line in results:
+            if line.strip():
+                record = json.loads(line)
+                records[record["name"]] = record
+    return [records[name] for name in sorted(records)]
+
+
+def write_html_report(records, html_path):
+    """Write an HTML summary of comparison records, with the page diffs when they were kept"""
+    with open(html_path, "w", encoding="utf-8") as report:
+        report.write(
+            "<!DOCTYPE html>\n<html><head><meta charset='utf-8'><title>PDF comparison report</title>"
+            "<style>body{font-family:sans-serif} table{border-collapse:collapse} "
+            "td,th{border:1px solid #ddd;padding:4px 8px} .added{color:green;background:#e6ffe6} "
+            ".removed{color:red;background:#ffe6e6} pre{white-space:pre-wrap}</style></head><body>\n"
+            "<h1>PDF comparison report</h1>\n<table><tr><th>Document</th><th>Status</th><th>Pages</th>"
+            "<th>Changed pages</th><th>Added lines</th><th>Removed lines</th></tr>\n"
+        )
+        for record in records:
+            if record["status"] != "ok":
+                report.write(
+                    f"<tr><td>{html.escape(record['name'])}</td>"
+                    f"<td colspan='5'>Error: {html.escape(record['error'])}</td></tr>\n"
+                )
+                continue
+            report.write(
+                f"<tr><td><a href='#{html.escape(record['name'], quote=True)}'>{html.escape(record['name'])}</a></td>"
+                f"<td>ok</td><td>{record['pages']}</td><td>{len(record['changed_pages'])}</td>"
+                f"<td>{record['added_lines']}</td><td>{record['removed_lines']}</td></tr>\n"
+            )
+        report.write("</table>\n")
+
+        for record in records:
+            if record["status"] != "ok" or not record["changed_pages"]:
+                continue
+            report.write(f"<h2 id='{html.escape(record['name'], quote=True)}'>{html.escape(record['name'])}</h2>\n")
+            for page in record["changed_pages"]:
+                report.write(
+                    f"<h3>Original page {page['original_page'] or '-'}, "
+                    f"comparison page {page['comparison_page'] or '-'}: "
+                    f"+{page['added_lines']} -{page['removed_lines']}</h3>\n"
+                )
+                page_diff = record.get("diffs", {}).get(str(page["position"]))
+                if not page_diff:
+                    continue
+                report.write("<pre>")
+                for line in page_diff[2:]:
+                    css_class = "added" if line.startswith("+") else "removed" if line.startswith("-") else ""
+                    report.write(f"<span class='{css_class}'>{html.escape(line)}</span>\n")
+                report.write("</pre>\n")
+        report.write("</body></html>\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the PDFs of two directories, pairing files by name")
+    parser.add_argument("original_dir", help="Directory with the original PDFs")
+    parser.add_argument("comparison_dir", help="Directory with the PDFs to compare against")
+    parser.add_argument("-o", "--output", default="comparison_results.jsonl", help="JSON Lines results file")
+    parser.add_argument("--html", help="Also write an HTML report of all results")
+    parser.add_argument("--manifest", help="Completed pairs, defaults to <output>.manifest")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--include-diffs", action="store_true", help="Keep the page diffs in the results")
+    args = parser.parse_args(argv)
+
+    manifest_path = args.manifest or args.output + ".manifest"
+    pairs, unmatched = pair_files(args.original_dir, args.comparison_dir)
+    for name in unmatched:
+        print(f"[!] No counterpart for {name}, skipping", file=sys.stderr)
+
+    completed = load_manifest(manifest_path)
+    pending = [pair for pair in pairs if pair[0] not in completed]
+    print(f"[*] {len(pairs)} pairs, {len(pairs) - len(pending)} already done, {len(pending)} to compare")
+
+    failed = 0
+    with open(args.output, "a", encoding="utf-8") as results, \
+            open(manifest_path, "a", encoding="utf-8") as manifest, \
+            ProcessPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [
+            executor.submit(compare_files, name, original_path, comparison_path, args.include_diffs)
+            for name, original_path, comparison_path in pending
+        ]
+        for done, future in enumerate(as_completed(futures), start=1):
+            record = future.result()
+            results.write(json.dumps(record) + "\n")
+            results.flush()
+
+            if record["status"] == "ok":
+                # Only successful pairs are skipped on the next run
+                manifest.write(record["name"] + "\n")
+                manifest.flush()
+                print(f"[{done}/{len(pending)}] {record['name']}: {len(record['changed_pages'])} changed pages")
+            else:
+                failed += 1
+                print(f"[{done}/{len(pending)}] {record['name']}: error: {record['error']}", file=sys.stderr)
+
+    if args.html:
+        write_html_report(load_records(args.output), args.html)
+        print(f"[*] HTML report written to {args.html}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
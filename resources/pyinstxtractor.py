@@ -1,5 +1,5 @@
 """
-PyInstaller Extractor v1.9 (Supports pyinstaller 3.3, 3.2, 3.1, 3.0, 2.1, 2.0)
+PyInstaller Extractor v1.10 (Supports pyinstaller 3.3, 3.2, 3.1, 3.0, 2.1, 2.0)
 Author : Extreme Coders
 E-mail : extremecoders(at)hotmail(dot)com
 Web    : https://0xec.blogspot.com
@@ -20,9 +20,32 @@ extracting the PYZ archive.
 Usage : Just copy this script to the directory where your exe resides
         and run the script with the exe file name as a parameter
 
-C:\path\to\exe\>python pyinstxtractor.py <filename>
+C:\\path\\to\\exe\\>python pyinstxtractor.py <filename>
 $ /path/to/exe/python pyinstxtractor.py <filename>
 
+Options:
+  --mmap    Map the executable into memory instead of reading it. Entries are
+            decompressed straight from the mapping and the PYZ archive is read
+            in place, without reading back the copy written to disk. Large
+            archives are extracted faster and with less memory. Python 3 only.
+  --jobs N  Decompress and write the files on N threads. At most 4*N files
+            and 64 MB of their data are held in memory at a time. The
+            extracted files are the same as without --jobs. Python 3 only.
+
+As a library, PyInstArchive reads single files and modules without extracting
+anything and without changing the working directory:
+
+    with PyInstArchive.load('app.exe') as arch:
+        for (pyzName, moduleName, ispkg) in arch.iterModules():
+            code = marshal.loads(arch.openModule(moduleName, pyzName).read())
+        data = arch.openEntry('main').read()
+
+load prints nothing and raises ArchiveError if the file cannot be opened or is
+not a pyinstaller archive. Pass verbose=True for the messages of the script.
+
+The PYZ tables of contents are read on first use and cached. The archive may be
+read from several threads at once.
+
 Licensed under GNU General Public License (GPL) v3.
 You are free to modify this source.
 
@@ -75,20 +98,48 @@ Version 1.9 (November 29, 2017)
 - Added support for pyinstaller 3.3
 - Display the scripts which are run at entry (Thanks to Michael Gillespie @ malwarehunterteam for the feature request)
 
+Version 1.10 (October 18, 2026)
+-------------------------------------------------
+- Added the --mmap option for zero-copy extraction from a memory mapping of the executable
+- Added the --jobs option to decompress and write files on several threads
+- Large entries are decompressed and written in chunks, memory use no longer grows with their size
+- Reader API to list entries and open single files and modules as streams
+- The working directory is no longer changed during extraction
+- The CArchive table of contents is read at once and parsed in place, entries use less memory
+- PyInstArchive.load opens an archive quietly for library use and raises ArchiveError on failure
+- Runs on python 3.12+, the pyc magic number is read from importlib instead of the removed imp module
+
 """
 
 from __future__ import print_function
+import io
 import os
+import mmap
+import shutil
 import struct
 import marshal
 import zlib
 import sys
-import imp
-import types
+import threading
 from uuid import uuid4 as uniquename
 
+try:
+    from importlib.util import MAGIC_NUMBER as PYC_MAGIC
+except ImportError:
+    # Python 2 and 3.3, imp is gone from python 3.12
+    import imp
+    PYC_MAGIC = imp.get_magic()
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None   # Python 2
+
+
+class CTOCEntry(object):
+    # Archives can have tens of thousands of entries, slots keep them small
+    __slots__ = ('position', 'cmprsdDataSize', 'uncmprsdDataSize', 'cmprsFlag', 'typeCmprsData', 'name')
 
-class CTOCEntry:
     def __init__(self, position, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, name):
         self.position = position
         self.cmprsdDataSize = cmprsdDataSize
@@ -98,13 +149,62 @@ class CTOCEntry:
         self.name = name
 
 
+class ArchiveError(Exception):
+    # Raised by PyInstArchive.load when a file cannot be read as a pyinstaller archive
+    pass
+
+
 class PyInstArchive:
     PYINST20_COOKIE_SIZE = 24           # For pyinstaller 2.0
     PYINST21_COOKIE_SIZE = 24 + 64      # For pyinstaller 2.1+
     MAGIC = b'MEI\014\013\012\013\016'  # Magic number which identifies pyinstaller
+    MAX_IN_FLIGHT_BYTES = 64 * 1024 * 1024  # Entry data held by queued jobs with --jobs
+    CHUNK_SIZE = 1024 * 1024                # Larger entries are decompressed and written in chunks
+    # entrySize, entryPos, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, followed by the name
+    TOC_ENTRY_STRUCT = struct.Struct('!iiiiBc')
 
-    def __init__(self, path):
+    def __init__(self, path, useMmap=False, jobs=1, verbose=True):
         self.filePath = path
+        self.useMmap = useMmap
+        self.jobs = jobs
+        self.verbose = verbose
+        self.lastError = None
+        self.mapping = None
+        self.view = None
+        self.readLock = threading.Lock()
+        self.indexLock = threading.RLock()
+        self.pyzIndexes = {}
+        self.moduleIndex = None
+
+
+    @classmethod
+    def load(cls, path, useMmap=False, jobs=1, verbose=False):
+        # Open an archive and parse its table of contents, ready for the reader
+        # API or extractFiles. Prints nothing unless verbose is set, and raises
+        # ArchiveError instead of returning False.
+        arch = cls(path, useMmap, jobs, verbose)
+        if not arch.open():
+            raise ArchiveError(arch.lastError)
+
+        try:
+            loaded = arch.checkFile() and arch.getCArchiveInfo() and arch.parseTOC()
+        except Exception as e:
+            # Tampered files can fail in other ways, e.g. names that are not utf-8
+            arch.lastError = 'Could not read the archive: {0}'.format(e)
+            loaded = False
+
+        if not loaded:
+            arch.close()
+            raise ArchiveError(arch.lastError)
+        return arch
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *excInfo):
+        self.close()
 
 
     def open(self):
@@ -112,39 +212,84 @@ class PyInstArchive:
             self.fPtr = open(self.filePath, 'rb')
             self.fileSize = os.stat(self.filePath).st_size
         except:
-            print('[*] Error: Could not open {0}'.format(self.filePath))
+            self._error('Could not open {0}'.format(self.filePath))
             return False
+
+        if self.useMmap:
+            # zlib and marshal only accept memoryviews in python 3
+            if sys.version_info[0] < 3:
+                self._log('[!] Warning: --mmap needs python 3, reading the file instead')
+            else:
+                try:
+                    self.mapping = mmap.mmap(self.fPtr.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.view = memoryview(self.mapping)
+                except:
+                    self._log('[!] Warning: Could not map {0} into memory, reading the file instead'.format(self.filePath))
         return True
 
 
+    def _log(self, message):
+        if self.verbose:
+            print(message)
+
+
+    def _error(self, message):
+        # The message is kept for ArchiveError, the caller returns False
+        self.lastError = message
+        self._log('[*] Error : {0}'.format(message))
+
+
     def close(self):
+        try:
+            if self.view is not None:
+                self.view.release()
+                self.mapping.close()
+            self.view = self.mapping = None
+        except:
+            pass
+
         try:
             self.fPtr.close()
         except:
             pass
 
 
+    def _read(self, position, size):
+        # Slices of the mapping are views, no data is copied before it is decompressed or written
+        if self.view is not None:
+            return self.view[position:position + size]
+
+        # Readers of several threads share the file position
+        with self.readLock:
+            self.fPtr.seek(position, os.SEEK_SET)
+            return self.fPtr.read(size)
+
+
     def checkFile(self):
-        print('[*] Processing {0}'.format(self.filePath))
+        self._log('[*] Processing {0}'.format(self.filePath))
+        if self.fileSize < self.PYINST20_COOKIE_SIZE:
+            self._error('The file is too small to be a pyinstaller archive')
+            return False
+
         # Check if it is a 2.0 archive
         self.fPtr.seek(self.fileSize - self.PYINST20_COOKIE_SIZE, os.SEEK_SET)
         magicFromFile = self.fPtr.read(len(self.MAGIC))
 
         if magicFromFile == self.MAGIC:
             self.pyinstVer = 20     # pyinstaller 2.0
-            print('[*] Pyinstaller version: 2.0')
+            self._log('[*] Pyinstaller version: 2.0')
             return True
 
         # Check for pyinstaller 2.1+ before bailing out
-        self.fPtr.seek(self.fileSize - self.PYINST21_COOKIE_SIZE, os.SEEK_SET)
+        self.fPtr.seek(max(self.fileSize - self.PYINST21_COOKIE_SIZE, 0), os.SEEK_SET)
         magicFromFile = self.fPtr.read(len(self.MAGIC))
 
         if magicFromFile == self.MAGIC:
-            print('[*] Pyinstaller version: 2.1+')
+            self._log('[*] Pyinstaller version: 2.1+')
             self.pyinstVer = 21     # pyinstaller 2.1+
             return True
 
-        print('[*] Error : Unsupported pyinstaller version or not a pyinstaller archive')
+        self._error('Unsupported pyinstaller version or not a pyinstaller archive')
         return False
 
 
@@ -165,10 +310,10 @@ class PyInstArchive:
                 struct.unpack('!8siiii64s', self.fPtr.read(self.PYINST21_COOKIE_SIZE))
 
         except:
-            print('[*] Error : The file is not a pyinstaller archive')
+            self._error('The file is not a pyinstaller archive')
             return False
 
-        print('[*] Python version: {0}'.format(self.pyver))
+        self._log('[*] Python version: {0}'.format(self.pyver))
 
         # Overlay is the data appended at the end of the PE
         self.overlaySize = lengthofPackage
@@ -176,159 +321,476 @@ class PyInstArchive:
         self.tableOfContentsPos = self.overlayPos + toc
         self.tableOfContentsSize = tocLen
 
-        print('[*] Length of package: {0} bytes'.format(self.overlaySize))
+        self._log('[*] Length of package: {0} bytes'.format(self.overlaySize))
         return True
 
 
     def parseTOC(self):
-        # Go to the table of contents
-        self.fPtr.seek(self.tableOfContentsPos, os.SEEK_SET)
-
-        self.tocList = []
+        # Read the table of contents at once. With --mmap it is copied out of the
+        # mapping, slicing names from bytes is cheaper than from a memoryview.
+        toc = self._read(self.tableOfContentsPos, self.tableOfContentsSize)
+        if isinstance(toc, memoryview):
+            toc = toc.tobytes()
+
+        unpackEntry = self.TOC_ENTRY_STRUCT.unpack_from
+        headerSize = self.TOC_ENTRY_STRUCT.size
+        overlayPos = self.overlayPos
+        tocList = []
+        tocIndex = {}
         parsedLen = 0
 
         # Parse table of contents
         while parsedLen < self.tableOfContentsSize:
-            (entrySize, ) = struct.unpack('!i', self.fPtr.read(4))
-            nameLen = struct.calcsize('!iiiiBc')
+            if parsedLen + headerSize > len(toc):
+                self._error('The table of contents is truncated')
+                return False
 
-            (entryPos, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData, name) = \
-            struct.unpack( \
-                '!iiiBc{0}s'.format(entrySize - nameLen), \
-                self.fPtr.read(entrySize - 4))
+            (entrySize, entryPos, cmprsdDataSize, uncmprsdDataSize, cmprsFlag, typeCmprsData) = \
+            unpackEntry(toc, parsedLen)
 
-            name = name.decode('utf-8').rstrip('\0')
+            # Tampered sizes would otherwise stop the parser from advancing or read past the table
+            if entrySize < headerSize or parsedLen + entrySize > self.tableOfContentsSize:
+                self._error('Invalid entry size {0} at offset {1} of the table of contents'.format(entrySize, parsedLen))
+                return False
+
+            name = toc[parsedLen + headerSize:parsedLen + entrySize].decode('utf-8').rstrip('\0')
             if len(name) == 0:
                 name = str(uniquename())
-                print('[!] Warning: Found an unamed file in CArchive. Using random name {0}'.format(name))
-
-            self.tocList.append( \
-                                CTOCEntry(                      \
-                                    self.overlayPos + entryPos, \
-                                    cmprsdDataSize,             \
-                                    uncmprsdDataSize,           \
-                                    cmprsFlag,                  \
-                                    typeCmprsData,              \
-                                    name                        \
-                                ))
+                self._log('[!] Warning: Found an unamed file in CArchive. Using random name {0}'.format(name))
+
+            # Of entries with the same name the last one wins, like when extracting
+            tocIndex[name] = len(tocList)
+            tocList.append(CTOCEntry(overlayPos + entryPos, cmprsdDataSize, uncmprsdDataSize,
+                                     cmprsFlag, typeCmprsData, name))
 
             parsedLen += entrySize
-        print('[*] Found {0} files in CArchive'.format(len(self.tocList)))
 
+        self.tocList = tocList
+        self.tocIndex = tocIndex
+        self._log('[*] Found {0} files in CArchive'.format(len(self.tocList)))
+        return True
 
 
-    def extractFiles(self):
-        print('[*] Beginning extraction...please standby')
-        extractionDir = os.path.join(os.getcwd(), os.path.basename(self.filePath) + '_extracted')
+    def extractFiles(self, extractionDir=None):
+        self._log('[*] Beginning extraction...please standby')
+        if extractionDir is None:
+            extractionDir = os.path.join(os.getcwd(), os.path.basename(self.filePath) + '_extracted')
 
         if not os.path.exists(extractionDir):
             os.mkdir(extractionDir)
 
-        os.chdir(extractionDir)
+        self.pool = None
+        if self.jobs > 1:
+            if ThreadPoolExecutor is None:
+                self._log('[!] Warning: --jobs needs python 3, extracting serially')
+            else:
+                self.pool = BoundedPool(self.jobs, self.MAX_IN_FLIGHT_BYTES, self._log)
 
-        for entry in self.tocList:
-            basePath = os.path.dirname(entry.name)
-            if basePath != '':
-                # Check if path exists, create if not
-                if not os.path.exists(basePath):
-                    os.makedirs(basePath)
+        try:
+            for (index, entry) in enumerate(self.tocList):
+                path = os.path.join(extractionDir, entry.name)
+                basePath = os.path.dirname(path)
+                if basePath != '':
+                    # Check if path exists, create if not
+                    if not os.path.exists(basePath):
+                        os.makedirs(basePath)
+
+                if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
+                    # The members are read from the pyz, so it is written before they are queued
+                    if self.view is not None:
+                        data = self._decompressEntry(entry, self._read(entry.position, entry.cmprsdDataSize))
+                        with open(path, 'wb') as f:
+                            f.write(data)
+                        # Read the pyz in place instead of reading back the copy just written
+                        self._extractPyz(path, memoryview(data))
+                    else:
+                        self._streamEntry(entry, path)
+                        self._extractPyz(path)
+                    continue
+
+                # Entries are written concurrently with --jobs, so of several entries with
+                # the same name only the last one is written, as it overwrites the others
+                if self.pool is not None and self.tocIndex[entry.name] != index:
+                    continue
+
+                if max(entry.cmprsdDataSize, entry.uncmprsdDataSize) <= self.CHUNK_SIZE:
+                    size = entry.cmprsdDataSize + entry.uncmprsdDataSize
+                    self._reserve(size)
+                    self._submit(size, self._extractEntry, entry, path, self._read(entry.position, entry.cmprsdDataSize))
+
+                elif self.view is not None:
+                    # Slicing the mapping is thread-safe, so large entries are streamed on the pool too
+                    self._reserve(2 * self.CHUNK_SIZE)
+                    self._submit(2 * self.CHUNK_SIZE, self._streamEntry, entry, path)
+
+                else:
+                    self._streamEntry(entry, path)
+
+                if entry.typeCmprsData == b's':
+                    self._log('[+] Possible entry point: {0}'.format(entry.name))
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool = None
+
+
+    def _reserve(self, size):
+        if self.pool is not None:
+            self.pool.reserve(size)
+
+
+    def _submit(self, size, func, *args):
+        # Runs func now without --jobs, the message it returns (if any) is printed
+        if self.pool is not None:
+            self.pool.submit(size, func, *args)
+            return
 
-            self.fPtr.seek(entry.position, os.SEEK_SET)
-            data = self.fPtr.read(entry.cmprsdDataSize)
+        message = func(*args)
+        if message is not None:
+            self._log(message)
+
+
+    def _decompressEntry(self, entry, data):
+        if entry.cmprsFlag == 1:
+            data = zlib.decompress(data)
+            # Malware may tamper with the uncompressed size
+            # Comment out the assertion in such a case
+            assert len(data) == entry.uncmprsdDataSize # Sanity Check
+        return data
+
+
+    def _extractEntry(self, entry, path, data):
+        data = self._decompressEntry(entry, data)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+
+    def _streamEntry(self, entry, path):
+        # Copy an entry to its file in chunks, memory use does not grow with the size of the entry
+        with self._openStream(entry) as stream:
+            with open(path, 'wb') as f:
+                shutil.copyfileobj(stream, f, self.CHUNK_SIZE)
+
+
+    def _openStream(self, entry):
+        return io.BufferedReader(MemberStream(self._read, entry.position, entry.cmprsdDataSize,
+                                              entry.cmprsFlag == 1, entry.uncmprsdDataSize, self.CHUNK_SIZE))
+
+
+    def listEntries(self):
+        # The CTOCEntry of every file in the CArchive, in archive order
+        return list(self.tocList)
+
+
+    def getEntry(self, name):
+        # Raises KeyError for unknown names, of entries with the same name the last one is returned
+        return self.tocList[self.tocIndex[name]]
+
+
+    def openEntry(self, name):
+        # Read-only file-like object over the (decompressed) data of a CArchive entry
+        return self._openStream(self.getEntry(name))
+
+
+    def iterModules(self):
+        # Yields (pyz name, module name, ispkg) for the modules of every pyz in the
+        # archive, the TOC of a pyz is only read once the iteration reaches it
+        for entry in self.tocList:
+            if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
+                (readAt, pycHeader, toc) = self._pyzIndex(entry)
+                for (moduleName, (ispkg, pos, length)) in toc.items():
+                    yield (entry.name, moduleName, ispkg)
+
+
+    def openModule(self, name, pyzName=None):
+        # Read-only file-like object over the marshalled code of a module in a pyz,
+        # without the pyc header. Reading an encrypted module raises zlib.error.
+        if pyzName is not None:
+            (readAt, pycHeader, toc) = self._pyzIndex(self.getEntry(pyzName))
+        else:
+            (readAt, pycHeader, toc) = self._moduleIndex()[name]
+
+        (ispkg, pos, length) = toc[name]
+        return io.BufferedReader(MemberStream(readAt, pos, length, True, None, self.CHUNK_SIZE))
+
+
+    def _moduleIndex(self):
+        # Module name -> index of the first pyz containing it, built on first use
+        with self.indexLock:
+            if self.moduleIndex is None:
+                moduleIndex = {}
+                for entry in self.tocList:
+                    if entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
+                        pyzIndex = self._pyzIndex(entry)
+                        for moduleName in pyzIndex[2]:
+                            moduleIndex.setdefault(moduleName, pyzIndex)
+                self.moduleIndex = moduleIndex
+            return self.moduleIndex
+
+
+    def _pyzIndex(self, entry):
+        # (readAt, pyc magic, TOC of module name -> (ispkg, pos, length)) of a pyz, cached
+        with self.indexLock:
+            if entry.name in self.pyzIndexes:
+                return self.pyzIndexes[entry.name]
 
             if entry.cmprsFlag == 1:
-                data = zlib.decompress(data)
-                # Malware may tamper with the uncompressed size
-                # Comment out the assertion in such a case
-                assert len(data) == entry.uncmprsdDataSize # Sanity Check
+                # A compressed pyz cannot be read at random positions, it is decompressed once
+                data = memoryview(self._decompressEntry(entry, self._read(entry.position, entry.cmprsdDataSize)))
+                readAt = lambda pos, length: data[pos:pos + length]
+            else:
+                readAt = lambda pos, length: self._read(entry.position + pos, length)
+
+            pyzMagic = bytes(readAt(0, 4))
+            assert pyzMagic == b'PYZ\0' # Sanity Check
+            pycHeader = bytes(readAt(4, 4)) # Python magic value
+
+            (tocPosition, ) = struct.unpack('!i', readAt(8, 4))
+            toc = marshal.loads(bytes(readAt(tocPosition, entry.uncmprsdDataSize - tocPosition)))
+
+            # From pyinstaller 3.1+ toc is a list of tuples, for Python > 3.3 some keys are bytes
+            if type(toc) != list:
+                toc = toc.items()
+            toc = dict((key.decode('utf-8') if isinstance(key, bytes) else key, value) for (key, value) in toc)
 
-            with open(entry.name, 'wb') as f:
-                f.write(data)
+            self.pyzIndexes[entry.name] = (readAt, pycHeader, toc)
+            return self.pyzIndexes[entry.name]
 
-            if entry.typeCmprsData == b's':
-            	print('[+] Possible entry point: {0}'.format(entry.name))
 
-            elif entry.typeCmprsData == b'z' or entry.typeCmprsData == b'Z':
-                self._extractPyz(entry.name)
+    def _extractPyz(self, name, pyzData=None):
+        if pyzData is not None:
+            self._extractPyzMembers(name,
+                                    lambda pos, length: pyzData[pos:pos + length],
+                                    lambda pos: marshal.loads(pyzData[pos:]))
+            return
+
+        with open(name, 'rb') as f:
+            def readAt(pos, length):
+                f.seek(pos, os.SEEK_SET)
+                return f.read(length)
+
+            def loadAt(pos):
+                f.seek(pos, os.SEEK_SET)
+                return marshal.load(f)
+
+            self._extractPyzMembers(name, readAt, loadAt)
 
 
-    def _extractPyz(self, name):
+    def _extractPyzMembers(self, name, readAt, loadAt):
         dirName =  name + '_extracted'
         # Create a directory for the contents of the pyz
         if not os.path.exists(dirName):
             os.mkdir(dirName)
 
-        with open(name, 'rb') as f:
-            pyzMagic = f.read(4)
-            assert pyzMagic == b'PYZ\0' # Sanity Check
+        pyzMagic = bytes(readAt(0, 4))
+        assert pyzMagic == b'PYZ\0' # Sanity Check
+
+        pycHeader = bytes(readAt(4, 4)) # Python magic value
+
+        if PYC_MAGIC != pycHeader:
+            self._log('[!] Warning: The script is running in a different python version than the one used to build the executable')
+            self._log('    Run this script in Python{0} to prevent extraction errors(if any) during unmarshalling'.format(self.pyver))
 
-            pycHeader = f.read(4) # Python magic value
+        (tocPosition, ) = struct.unpack('!i', readAt(8, 4))
+
+        try:
+            toc = loadAt(tocPosition)
+        except:
+            self._log('[!] Unmarshalling FAILED. Cannot extract {0}. Extracting remaining files.'.format(name))
+            return
 
-            if imp.get_magic() != pycHeader:
-                print('[!] Warning: The script is running in a different python version than the one used to build the executable')
-                print('    Run this script in Python{0} to prevent extraction errors(if any) during unmarshalling'.format(self.pyver))
+        self._log('[*] Found {0} files in PYZ archive'.format(len(toc)))
 
-            (tocPosition, ) = struct.unpack('!i', f.read(4))
-            f.seek(tocPosition, os.SEEK_SET)
+        # From pyinstaller 3.1+ toc is a list of tuples
+        if type(toc) == list:
+            toc = dict(toc)
 
+        for key in toc.keys():
+            (ispkg, pos, length) = toc[key]
+
+            fileName = key
             try:
-                toc = marshal.load(f)
+                # for Python > 3.3 some keys are bytes object some are str object
+                fileName = key.decode('utf-8')
             except:
-                print('[!] Unmarshalling FAILED. Cannot extract {0}. Extracting remaining files.'.format(name))
-                return
+                pass
 
-            print('[*] Found {0} files in PYZ archive'.format(len(toc)))
+            # Make sure destination directory exists, ensuring we keep inside dirName
+            destName = os.path.join(dirName, fileName.replace("..", "__"))
+            destDirName = os.path.dirname(destName)
+            if not os.path.exists(destDirName):
+                os.makedirs(destDirName)
 
-            # From pyinstaller 3.1+ toc is a list of tuples
-            if type(toc) == list:
-                toc = dict(toc)
+            # The uncompressed size of a member is not known before it is decompressed
+            self._reserve(length)
+            self._submit(length, self._extractPyzMember, destName, pycHeader, readAt(pos, length), fileName)
 
-            for key in toc.keys():
-                (ispkg, pos, length) = toc[key]
-                f.seek(pos, os.SEEK_SET)
 
-                fileName = key
-                try:
-                    # for Python > 3.3 some keys are bytes object some are str object
-                    fileName = key.decode('utf-8')
-                except:
-                    pass
+    def _extractPyzMember(self, destName, pycHeader, data, fileName):
+        try:
+            pycData = zlib.decompress(data)
+        except:
+            open(destName + '.pyc.encrypted', 'wb').write(data)
+            return '[!] Error: Failed to decompress {0}, probably encrypted. Extracting as is.'.format(fileName)
+
+        with open(destName + '.pyc', 'wb') as pycFile:
+            pycFile.write(pycHeader)      # Write pyc magic
+            pycFile.write(b'\0' * 4)      # Write timestamp
+            if self.pyver >= 33:
+                pycFile.write(b'\0' * 4)  # Size parameter added in Python 3.3
+            pycFile.write(pycData)
+
+
+class MemberStream(io.RawIOBase):
+    # Raw stream over size bytes at position of an archive, decompressed on the fly
+    # if compressed. readAt(position, size) must be safe to call from any thread.
+    def __init__(self, readAt, position, size, compressed, uncmprsdDataSize=None, chunkSize=1024 * 1024):
+        io.RawIOBase.__init__(self)
+        self.readAt = readAt
+        self.position = position
+        self.size = size
+        self.uncmprsdDataSize = uncmprsdDataSize
+        self.chunkSize = chunkSize
+        self.decompressor = zlib.decompressobj() if compressed else None
+        self.consumed = 0       # Bytes read from the archive
+        self.produced = 0       # Bytes of output
+        self.pending = b''      # Input the decompressor has not consumed yet
+        self.buffer = b''       # Output not returned yet
+        self.finished = False
 
-                # Make sure destination directory exists, ensuring we keep inside dirName
-                destName = os.path.join(dirName, fileName.replace("..", "__"))
-                destDirName = os.path.dirname(destName)
-                if not os.path.exists(destDirName):
-                    os.makedirs(destDirName)
 
-                try:
-                    data = f.read(length)
-                    data = zlib.decompress(data)
-                except:
-                    print('[!] Error: Failed to decompress {0}, probably encrypted. Extracting as is.'.format(fileName))
-                    open(destName + '.pyc.encrypted', 'wb').write(data)
-                    continue
+    def readable(self):
+        return True
+
 
-                with open(destName + '.pyc', 'wb') as pycFile:
-                    pycFile.write(pycHeader)      # Write pyc magic
-                    pycFile.write(b'\0' * 4)      # Write timestamp
-                    if self.pyver >= 33:
-                        pycFile.write(b'\0' * 4)  # Size parameter added in Python 3.3
-                    pycFile.write(data)
+    def readinto(self, b):
+        while len(self.buffer) == 0 and not self.finished:
+            self.buffer = self._next(len(b))
+
+        # Only the final flush of the decompressor can return more than was asked for
+        size = min(len(b), len(self.buffer))
+        b[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+    def _next(self, maxSize):
+        if self.decompressor is None:
+            size = min(maxSize, self.size - self.consumed)
+            data = self.readAt(self.position + self.consumed, size)
+            self.consumed += size
+            self.finished = self.consumed >= self.size
+            return data
+
+        if len(self.pending) == 0 and self.consumed < self.size:
+            size = min(self.chunkSize, self.size - self.consumed)
+            self.pending = self.readAt(self.position + self.consumed, size)
+            self.consumed += size
+
+        if len(self.pending) > 0:
+            # Limiting the output keeps highly compressed data from expanding in memory
+            data = self.decompressor.decompress(self.pending, maxSize)
+            self.pending = self.decompressor.unconsumed_tail
+        else:
+            data = self.decompressor.flush()
+            self.finished = True
+
+        self.produced += len(data)
+        if self.uncmprsdDataSize is not None:
+            # Malware may tamper with the uncompressed size
+            # Comment out the assertions in such a case
+            assert self.produced <= self.uncmprsdDataSize # Sanity Check
+            assert not self.finished or self.produced == self.uncmprsdDataSize # Sanity Check
+        return data
+
+
+class BoundedPool:
+    # Thread pool for the decompress and write jobs of --jobs, zlib and file
+    # writes release the GIL. Reserving blocks while too many jobs or too many
+    # bytes of entry data are queued or running. The messages returned by the
+    # jobs are passed to log in submission order, independent of the scheduling.
+    def __init__(self, jobs, maxBytes, log=print):
+        self.executor = ThreadPoolExecutor(jobs)
+        self.log = log
+        self.maxJobs = 4 * jobs
+        self.maxBytes = maxBytes
+        self.jobsInFlight = 0
+        self.bytesInFlight = 0
+        self.condition = threading.Condition()
+        self.futures = []
+
+
+    def reserve(self, size):
+        with self.condition:
+            # An entry larger than maxBytes is only started once the pool is idle
+            while self.jobsInFlight >= self.maxJobs or \
+                  (self.jobsInFlight > 0 and self.bytesInFlight + size > self.maxBytes):
+                self.condition.wait()
+            self.jobsInFlight += 1
+            self.bytesInFlight += size
+
+
+    def submit(self, size, func, *args):
+        future = self.executor.submit(func, *args)
+        future.add_done_callback(lambda future: self._release(size))
+        self.futures.append(future)
+
+
+    def _release(self, size):
+        with self.condition:
+            self.jobsInFlight -= 1
+            self.bytesInFlight -= size
+            self.condition.notify_all()
+
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+        for future in self.futures:
+            message = future.result()
+            if message is not None:
+                self.log(message)
+        self.futures = []
+
+
+def parseArgs(args):
+    # Returns (fileName, useMmap, jobs), or None if the arguments are invalid
+    fileNames = []
+    useMmap = False
+    jobs = 1
+
+    i = 0
+    while i < len(args):
+        if args[i] == '--mmap':
+            useMmap = True
+        elif args[i] in ('--jobs', '-j'):
+            i += 1
+            try:
+                jobs = int(args[i])
+            except (IndexError, ValueError):
+                return None
+        else:
+            fileNames.append(args[i])
+        i += 1
+
+    if len(fileNames) != 1 or jobs < 1:
+        return None
+    return (fileNames[0], useMmap, jobs)
 
 
 def main():
-    if len(sys.argv) < 2:
-        print('[*] Usage: pyinstxtractor.py <filename>')
+    args = parseArgs(sys.argv[1:])
+
+    if args is None:
+        print('[*] Usage: pyinstxtractor.py [--mmap] [--jobs N] <filename>')
 
     else:
-        arch = PyInstArchive(sys.argv[1])
+        arch = PyInstArchive(*args)
         if arch.open():
             if arch.checkFile():
-                if arch.getCArchiveInfo():
-                    arch.parseTOC()
+                if arch.getCArchiveInfo() and arch.parseTOC():
                     arch.extractFiles()
                     arch.close()
-                    print('[*] Successfully extracted pyinstaller archive: {0}'.format(sys.argv[1]))
+                    print('[*] Successfully extracted pyinstaller archive: {0}'.format(arch.filePath))
                     print('')
                     print('You can now use a python decompiler on the pyc files within the extracted directory')
                     return
@@ -0,0 +1,18 @@
+"""
+Keep the extraction cache and document store of the tests out of the shared defaults
+
+Both are created when pdf_compare and app are imported, so the environment is
+set here before any test module is collected.
+"""
+
+import os
+import shutil
+import tempfile
+
+STATE_DIR = tempfile.mkdtemp(prefix="pdf_compare_test_")
+os.environ["PDF_STORE_DIR"] = os.path.join(STATE_DIR, "store")
+os.environ["PDF_CACHE_PATH"] = os.path.join(STATE_DIR, "cache.sqlite3")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(STATE_DIR, ignore_errors=True)
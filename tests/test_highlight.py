@@ -0,0 +1,56 @@
+"""
+Numeric tolerance must only hide numbers that really changed within it
+"""
+
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from diff_engine import highlight_changes, parse_number
+
+
+def highlighted(old, new, **tolerance):
+    """The marked parts of the removed and the added line"""
+    (removed, removed_ranges), (added, added_ranges) = highlight_changes(
+        ["@@ -1 +1 @@", "-" + old, "+" + new], **tolerance
+    )
+    return [removed[a:b] for a, b in removed_ranges], [added[a:b] for a, b in added_ranges]
+
+
+@pytest.mark.parametrize("token, value", [
+    ("1,234.56", 1234.56),
+    ("1.234,56", 1234.56),
+    ("1.234,56-", -1234.56),
+    ("(1,234.56)", -1234.56),
+    ("1'234.50", 1234.5),
+    ("1.234.567", 1234567),
+    ("12,5%", 12.5),
+    ("1,234", None),
+    ("1.234", None),
+])
+def test_parse_number(token, value):
+    assert parse_number(token) == value
+
+
+def test_decimal_comma_change_beyond_tolerance_is_marked():
+    assert highlighted("Total 1.234,56 EUR", "Total 1.239,56 EUR", abs_tolerance=0.01) == (
+        ["1.234,56"], ["1.239,56"]
+    )
+
+
+def test_decimal_comma_change_within_tolerance_is_not_marked():
+    assert highlighted("Total 1.234,56 EUR", "Total 1.234,57 EUR", abs_tolerance=0.01) == ([], [])
+
+
+def test_trailing_minus_is_a_sign():
+    assert highlighted("Saldo 1.234,56-", "Saldo 1.234,56", abs_tolerance=0.01) == (
+        ["1.234,56-"], ["1.234,56"]
+    )
+
+
+def test_ambiguous_numbers_are_compared_exactly():
+    assert highlighted("Units 1,234", "Units 1,235", abs_tolerance=10) == (["1,234"], ["1,235"])
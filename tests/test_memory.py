@@ -0,0 +1,33 @@
+"""
+A ComparisonResult must retain less memory than the dicts of strings it replaced
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "benchmarks"))
+
+from memory_benchmark import dict_layout, make_documents, retained_bytes
+from pdf_compare import ComparisonResult
+
+PAGES = 200
+LINES_PER_PAGE = 60
+CHANGED_PAGE_RATIO = 0.05
+
+
+def documents():
+    """The same pair of documents on every call"""
+    return make_documents(PAGES, LINES_PER_PAGE, CHANGED_PAGE_RATIO, random.Random(7))
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+def test_comparison_result_retains_less_than_dicts(lazy):
+    dict_bytes, _ = retained_bytes(lambda: dict_layout(*documents()))
+    result_bytes, _ = retained_bytes(lambda: ComparisonResult(*documents(), lazy=lazy))
+
+    assert result_bytes < dict_bytes